@@ -0,0 +1,239 @@
+"""
+Measure seeking and playback performance of subtitle_editor.video.Video on
+synthetic test videos generated with ffmpeg's lavfi sources. Frames are
+decoded as usual but never displayed, and audio goes to a null sink that
+consumes it in real time, so this runs on a headless machine without a
+sound card.
+
+Run it from the root of the repository, with the package either installed
+(`pip install -e .`) or on the path:
+
+    PYTHONPATH=. python benchmarks/bench_media.py --duration 60 --size 1920x1080
+"""
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+import click
+import ffmpeg
+import numpy as np
+import pyaudio
+
+from subtitle_editor.constants import AUDIO_FRAME_SIZE
+from subtitle_editor.video import Video
+
+# name: (codec, GOP size, extra output options)
+VARIANTS = {
+    "h264-gop12": ("libx264", 12, {"preset": "veryfast", "pix_fmt": "yuv420p"}),
+    "h264-gop250": ("libx264", 250, {"preset": "veryfast", "pix_fmt": "yuv420p"}),
+    "mpeg4-gop30": ("mpeg4", 30, {"q:v": 5}),
+    "mjpeg": ("mjpeg", 1, {"q:v": 5, "pix_fmt": "yuvj420p"}),
+}
+NULL_AUDIO_CHUNK = 1024
+
+
+def generate_video(path, variant, duration, size, fps):
+    codec, gop, options = VARIANTS[variant]
+    video = ffmpeg.input(
+        f"testsrc2=size={size}:rate={fps}:duration={duration}", format="lavfi"
+    )
+    audio = ffmpeg.input(
+        f"sine=frequency=440:sample_rate=44100:duration={duration}", format="lavfi"
+    )
+    stream = ffmpeg.output(
+        video, audio, path, vcodec=codec, g=gop, acodec="aac", **options
+    )
+    ffmpeg.run(ffmpeg.overwrite_output(stream), quiet=True)
+
+
+class HeadlessVideo(Video):
+    # Decodes frames as normal but never displays them
+    def show(self, frame_data, frame=None):
+        pass
+
+
+class NullAudio:
+    # Stands in for pyaudio.PyAudio. Audio is pulled from the stream callback
+    # at the real-time rate and discarded.
+    def get_format_from_width(self, width):
+        return width
+
+    def open(self, format, channels, rate, output, stream_callback):
+        return NullAudioStream(rate, stream_callback)
+
+    def terminate(self):
+        pass
+
+
+class NullAudioStream:
+    def __init__(self, rate, callback):
+        self.rate = rate
+        self.callback = callback
+        # Audio frames consumed so far, and when the last chunk was pulled
+        self.frames_played = 0
+        self.played_at = None
+        self.running = False
+        self.thread = None
+        self.start_stream()
+
+    def position(self):
+        # Seconds of audio played, interpolated between chunks
+        if self.played_at is None:
+            return 0
+        elapsed = min(time.monotonic() - self.played_at, NULL_AUDIO_CHUNK / self.rate)
+        return self.frames_played / self.rate + elapsed
+
+    def start_stream(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        started_at = time.monotonic() - self.frames_played / self.rate
+        while self.running:
+            delay = started_at + self.frames_played / self.rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            data, flag = self.callback(None, NULL_AUDIO_CHUNK, {}, 0)
+            self.played_at = time.monotonic()
+            self.frames_played += len(data) // AUDIO_FRAME_SIZE
+            if flag == pyaudio.paComplete:
+                break
+
+    def stop_stream(self):
+        self.running = False
+        if self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def close(self):
+        self.stop_stream()
+
+
+def seek_patterns(frame_count, fps, seeks):
+    random.seed(0)
+    start = frame_count // 2
+    return {
+        # Holding down =
+        "step": [start + i for i in range(seeks)],
+        # Holding down -
+        "step-back": [start - i for i in range(seeks)],
+        # Holding down + (one second at a time)
+        "second": [1 + (i * round(fps)) % frame_count for i in range(seeks)],
+        # Jumping between subtitles
+        "random": [random.randint(1, frame_count) for _ in range(seeks)],
+    }
+
+
+def measure_seeks(video, frames):
+    # Latency of each frame request, waiting for each one before the next
+    latencies = []
+    for frame in frames:
+        done = []
+        requested_at = time.perf_counter()
+        video.frames.request(frame, lambda frame_data, frame: done.append(frame))
+        while not done and video.frames.connected:
+            video.frames.receive()
+        latencies.append(time.perf_counter() - requested_at)
+    return np.array(latencies) * 1000
+
+
+def measure_playback(video, start_frame, seconds, speed):
+    # Play like the editor does, showing each frame at `next_frame_time`.
+    # Returns (frames shown, wall time, drift per frame in ms), where drift is
+    # how far the video is ahead of the audio.
+    end_frame = min(start_frame + round(seconds * video.fps * speed), video.frame_count)
+    playback = video.play(start_frame, end_frame, speed)
+    ready = threading.Event()
+    playback.open_audio(lambda error: ready.set())
+    ready.wait()
+    playback.start(NullAudio)
+
+    drift = []
+    shown = 0
+    try:
+        while True:
+            delay = playback.next_frame_time() - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            frame = playback.read()
+            if frame is None:
+                break
+            shown += 1
+            video_position = (frame - start_frame) / video.fps
+            audio_position = playback.audio_stream.position() * speed
+            drift.append(video_position - audio_position)
+            if frame >= end_frame:
+                break
+        elapsed = time.monotonic() - playback.started_at
+    finally:
+        playback.stop()
+    return shown, elapsed, np.array(drift) * 1000
+
+
+def percentiles(values):
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return f"p50 {p50:6.1f}  p90 {p90:6.1f}  p99 {p99:6.1f}  max {values.max():6.1f}"
+
+
+@click.command()
+@click.option(
+    "--variant",
+    "variants",
+    multiple=True,
+    type=click.Choice(sorted(VARIANTS)),
+    help="Video variants to test  [default: all]",
+)
+@click.option("--duration", default=30, show_default=True, help="Seconds")
+@click.option("--size", default="1280x720", show_default=True)
+@click.option("--fps", default=30, show_default=True)
+@click.option("--seeks", default=100, show_default=True, help="Per seek pattern")
+@click.option("--play-seconds", default=5.0, show_default=True)
+@click.option("--speed", "speeds", multiple=True, type=float, help="[default: 1]")
+@click.option(
+    "--keep",
+    type=click.Path(file_okay=False),
+    help="Keep the generated videos in this directory and reuse them",
+)
+def main(variants, duration, size, fps, seeks, play_seconds, speeds, keep):
+    directory = keep or tempfile.mkdtemp(prefix="subtitle-editor-bench-")
+    os.makedirs(directory, exist_ok=True)
+    try:
+        for variant in variants or sorted(VARIANTS):
+            path = os.path.join(directory, f"{variant}-{size}-{fps}-{duration}.mkv")
+            if not os.path.exists(path):
+                click.echo(f"Generating {path}...")
+                generate_video(path, variant, duration, size, fps)
+
+            video = HeadlessVideo(path)
+            try:
+                click.echo(
+                    f"\n{variant}: {size} @ {video.fps:g} fps, "
+                    f"{video.frame_count} frames, "
+                    f"{os.path.getsize(path) / 1024 ** 2:.1f} MB"
+                )
+                patterns = seek_patterns(video.frame_count, video.fps, seeks)
+                for name, frames in patterns.items():
+                    latencies = measure_seeks(video, frames)
+                    click.echo(f"  seek {name:<10} ms  {percentiles(latencies)}")
+
+                for speed in speeds or (1,):
+                    shown, elapsed, drift = measure_playback(
+                        video, video.frame_count // 4, play_seconds, speed
+                    )
+                    click.echo(
+                        f"  play {speed:g}x  {shown / elapsed:6.1f} fps shown  "
+                        f"drift ms  mean {drift.mean():6.1f}  "
+                        f"max {np.abs(drift).max():6.1f}"
+                    )
+            finally:
+                video.close()
+    finally:
+        if not keep:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Compare the srt package's parser/composer with subtitle_editor's streaming
+implementation on a large generated SRT file.
+
+Run it from the root of the repository, with the package either installed
+(`pip install -e .`) or on the path:
+
+    PYTHONPATH=. python benchmarks/bench_srt.py --cues 100000
+"""
+import os
+import random
+import tempfile
+import time
+from datetime import timedelta
+
+import click
+import srt
+
+from subtitle_editor.subtitles import srt_format
+
+WORDS = "the quick brown fox jumps over a lazy dog <i>and</i> so on".split()
+
+
+def generate_subtitles(count):
+    random.seed(0)
+    subtitles = []
+    start = 0
+    for index in range(1, count + 1):
+        start += random.randint(100, 4000)
+        end = start + random.randint(500, 4000)
+        content = "\n".join(
+            " ".join(random.choices(WORDS, k=random.randint(2, 8)))
+            for _ in range(random.randint(1, 2))
+        )
+        subtitles.append(
+            srt.Subtitle(
+                index,
+                timedelta(milliseconds=start),
+                timedelta(milliseconds=end),
+                content,
+            )
+        )
+    return subtitles
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - t0)
+    return min(timings), result
+
+
+def report(name, baseline, optimized):
+    click.echo(
+        f"{name:<8} srt: {baseline:7.3f}s  subtitle_editor: {optimized:7.3f}s  "
+        f"({baseline / optimized:.1f}x)"
+    )
+
+
+@click.command()
+@click.option("--cues", default=100000, show_default=True)
+@click.option("--repeat", default=3, show_default=True)
+def main(cues, repeat):
+    subtitles = generate_subtitles(cues)
+    fd, path = tempfile.mkstemp(suffix=".srt")
+    with os.fdopen(fd, "w") as fp:
+        fp.write(srt.compose(subtitles))
+    click.echo(f"{cues} cues, {os.path.getsize(path) / 1024 ** 2:.1f} MB")
+
+    def parse_with_srt():
+        with open(path, "r") as fp:
+            return list(srt.parse(fp))
+
+    try:
+        baseline, expected = best_of(repeat, parse_with_srt)
+        optimized, (parsed, errors) = best_of(
+            repeat, lambda: srt_format.parse_file(path)
+        )
+        assert not errors and parsed == expected
+        report("parse", baseline, optimized)
+
+        baseline, expected = best_of(repeat, lambda: srt.compose(parsed))
+        optimized, composed = best_of(repeat, lambda: srt_format.compose(parsed))
+        assert composed == expected
+        report("compose", baseline, optimized)
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
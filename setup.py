@@ -17,13 +17,14 @@ DESCRIPTION = 'Edit subtitles in your terminal instead of a text editor.'
 URL = 'https://github.com/sandalwoodbox/subtitle-editor'
 EMAIL = 'boxofsandalwood@gmail.com'
 AUTHOR = 'sandalwoodbox'
-REQUIRES_PYTHON = '>=3.7.0'
+REQUIRES_PYTHON = '>=3.8.0'
 VERSION = ''  # Read from __version__.py
 
 # What packages are required for this module to be executed?
 REQUIRED = [
     "click",
     "ffmpeg-python",
+    "numpy",
     "opencv-python",
     "pyaudio",
     "srt",
@@ -126,7 +127,7 @@ setup(
         'License :: OSI Approved :: GNU General Public License v3 (GPLv3)',
         'Programming Language :: Python',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
         'Programming Language :: Python :: Implementation :: CPython',
         'Topic :: Multimedia :: Video',
     ],
@@ -0,0 +1,213 @@
+import math
+
+import ffmpeg
+import numpy as np
+
+from .constants import (
+    ALIGN_CUT_PENALTY,
+    ALIGN_MAX_LINE_SECONDS,
+    ALIGN_MAX_UNIT_SECONDS,
+    ALIGN_MIN_GAP_SECONDS,
+    ALIGN_MIN_SPEECH_SECONDS,
+    ALIGN_RATE,
+    ALIGN_REFINE_PASSES,
+    ALIGN_SKIP_PENALTY,
+    ALIGN_WINDOW_SECONDS,
+)
+
+WINDOW_SAMPLES = round(ALIGN_RATE * ALIGN_WINDOW_SECONDS)
+
+
+def read_envelope(path):
+    # Energy (in dB) of each ALIGN_WINDOW_SECONDS window of the audio track,
+    # decoded as low-rate mono PCM and reduced chunk by chunk so that memory
+    # use doesn't grow with the length of the video.
+    stream = ffmpeg.input(path)
+    stream = ffmpeg.output(
+        stream, "pipe:", format="s16le", acodec="pcm_s16le", ac=1, ar=ALIGN_RATE
+    )
+    stream = stream.global_args("-loglevel", "error")
+    process = ffmpeg.run_async(stream, pipe_stdout=True, quiet=True)
+
+    chunk_size = WINDOW_SAMPLES * 2 * 1000
+    envelopes = []
+    while True:
+        data = process.stdout.read(chunk_size)
+        if not data:
+            break
+        samples = np.frombuffer(data, dtype=np.int16)
+        samples = samples[: len(samples) - len(samples) % WINDOW_SAMPLES]
+        windows = samples.reshape(-1, WINDOW_SAMPLES).astype(np.float32)
+        power = np.mean(windows * windows, axis=1)
+        envelopes.append(10 * np.log10(power + 1))
+
+    stderr = process.stderr.read()
+    if process.wait() != 0:
+        raise ffmpeg.Error("ffmpeg", None, stderr)
+    if not envelopes:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(envelopes).astype(np.float32)
+
+
+def load_envelope(path, cache=None):
+    if cache is None:
+        return read_envelope(path)
+
+    key = cache.key(path)
+    cached = cache.get_path(key, "envelope")
+    if cached is not None:
+        return np.fromfile(cached, dtype=np.float32)
+
+    envelope = read_envelope(path)
+    cache.store(key, "envelope", envelope.tofile)
+    return envelope
+
+
+def runs(mask):
+    # (starts, ends) of each run of True values in a boolean array
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def find_speech(envelope):
+    # Returns (starts, ends) of the speech regions, in windows. Anything
+    # louder than a threshold between the noise floor and the loud parts
+    # counts as speech; short gaps are bridged and short blips dropped.
+    if len(envelope) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    noise, loud = np.percentile(envelope, [10, 90])
+    speech = envelope > noise + (loud - noise) * 0.4
+
+    # Bridge short gaps (but not leading/trailing silence) by marking every
+    # window inside them with a running count of gap starts minus gap ends
+    min_gap = round(ALIGN_MIN_GAP_SECONDS / ALIGN_WINDOW_SECONDS)
+    starts, ends = runs(~speech)
+    short = (ends - starts < min_gap) & (starts > 0) & (ends < len(speech))
+    bridge = np.zeros(len(speech) + 1, dtype=np.int64)
+    np.add.at(bridge, starts[short], 1)
+    np.add.at(bridge, ends[short], -1)
+    speech |= np.cumsum(bridge[:-1]) > 0
+
+    min_speech = round(ALIGN_MIN_SPEECH_SECONDS / ALIGN_WINDOW_SECONDS)
+    starts, ends = runs(speech)
+    keep = ends - starts >= min_speech
+    return starts[keep], ends[keep]
+
+
+def split_units(starts, ends, unit_length):
+    # Split speech regions into units no longer than `unit_length` windows,
+    # so that a line can start or end part of the way through a region.
+    pieces = np.maximum(1, np.ceil((ends - starts) / unit_length)).astype(np.int64)
+    region = np.repeat(np.arange(len(starts)), pieces)
+    offset = np.arange(len(region)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    length = (ends - starts)[region] / pieces[region]
+    unit_starts = starts[region] + np.floor(offset * length).astype(np.int64)
+    unit_ends = starts[region] + np.floor((offset + 1) * length).astype(np.int64)
+    return unit_starts, unit_ends
+
+
+def assign_lines(weights, unit_starts, unit_ends, total=None):
+    # Assign each line to a contiguous run of units by dynamic programming.
+    # A line's expected duration is its share (by weight) of `total` seconds
+    # (by default all of the speech); runs are scored by their squared
+    # deviation from it, plus a penalty for starting or ending mid-region, and
+    # units that are left out (music, noise) cost a fixed penalty per second.
+    # Returns an array of (first_unit, end_unit) per line.
+    n = len(weights)
+    k = len(unit_starts)
+    durations = (unit_ends - unit_starts) * ALIGN_WINDOW_SECONDS
+    speech = np.concatenate(([0], np.cumsum(durations)))
+    skip = speech * ALIGN_SKIP_PENALTY
+    # Lines should start and end in silence, so penalise boundaries between
+    # two units of the same speech region
+    cuts = np.zeros(k + 1)
+    cuts[1:-1][unit_starts[1:] == unit_ends[:-1]] = ALIGN_CUT_PENALTY
+    expected = (speech[-1] if total is None else total) * weights / weights.sum()
+
+    # Limit how many units a single line can span
+    longest = max(ALIGN_MAX_LINE_SECONDS, 3 * expected.max())
+    max_width = min(k, math.ceil(longest / max(durations.mean(), 1e-3)))
+
+    positions = np.arange(k + 1)
+    # best[b]: cost of placing the lines so far with the last one ending at
+    # boundary b (before unit b)
+    best = np.full(k + 1, np.inf)
+    best[0] = 0
+    skip_from = np.zeros((n, k + 1), dtype=np.int32)
+    widths = np.zeros((n, k + 1), dtype=np.int16)
+    for line in range(n):
+        # Cheapest way to reach boundary a with the previous line ending at
+        # or before a, skipping the units in between
+        values = best - skip
+        running = np.minimum.accumulate(values)
+        skip_from[line] = np.maximum.accumulate(
+            np.where(values == running, positions, 0)
+        )
+        start_cost = running + skip + cuts
+
+        target = expected[line]
+        new_best = np.full(k + 1, np.inf)
+        for width in range(1, max_width + 1):
+            duration = speech[width:] - speech[:-width]
+            cost = start_cost[:-width] + (duration - target) ** 2 / target
+            cost += cuts[width:]
+            better = cost < new_best[width:]
+            new_best[width:][better] = cost[better]
+            widths[line, width:][better] = width
+        best = new_best
+
+    end = int(np.argmin(best + skip[-1] - skip))
+    assignments = np.zeros((n, 2), dtype=np.int64)
+    for line in range(n - 1, -1, -1):
+        start = end - widths[line, end]
+        assignments[line] = (start, end)
+        end = skip_from[line, start]
+    return assignments
+
+
+def align(path, lines, cache=None):
+    # Estimate (start, end) times in seconds for each line of text, in
+    # order, from the speech in the video's audio track.
+    if not lines:
+        return []
+
+    envelope = load_envelope(path, cache)
+    starts, ends = find_speech(envelope)
+    if len(starts) == 0:
+        return [(None, None)] * len(lines)
+
+    # Make sure there are enough units for every line to get at least one
+    total_speech = (ends - starts).sum()
+    unit_length = max(
+        1,
+        min(
+            ALIGN_MAX_UNIT_SECONDS / ALIGN_WINDOW_SECONDS,
+            total_speech / (2 * len(lines)),
+        ),
+    )
+    unit_starts, unit_ends = split_units(starts, ends, unit_length)
+    if len(unit_starts) < len(lines):
+        return [(None, None)] * len(lines)
+
+    weights = np.array([max(len(line.strip()), 1) for line in lines], dtype=float)
+    assignments = assign_lines(weights, unit_starts, unit_ends)
+    # Long stretches of music or noise inflate how long each line is expected
+    # to be, which can make it cheaper to spread the lines over them than to
+    # skip them. Work the expected durations out again from just the speech
+    # that was assigned, until that settles.
+    windows = np.concatenate(([0], np.cumsum(unit_ends - unit_starts)))
+    for _ in range(ALIGN_REFINE_PASSES):
+        assigned = windows[assignments[:, 1]] - windows[assignments[:, 0]]
+        total = assigned.sum() * ALIGN_WINDOW_SECONDS
+        refined = assign_lines(weights, unit_starts, unit_ends, total)
+        if np.array_equal(refined, assignments):
+            break
+        assignments = refined
+    return [
+        (
+            unit_starts[first] * ALIGN_WINDOW_SECONDS,
+            unit_ends[last - 1] * ALIGN_WINDOW_SECONDS,
+        )
+        for first, last in assignments
+    ]
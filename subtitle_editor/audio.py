@@ -0,0 +1,198 @@
+import threading
+
+import numpy as np
+
+from .constants import STRETCH_TOLERANCE, STRETCH_WINDOW
+
+
+def output_latency(audio_stream, time_info=None):
+    # Seconds between audio being handed to PortAudio and it being heard.
+    # Inside a callback, `time_info` says exactly when the buffer will reach
+    # the DAC; otherwise fall back to the stream's reported latency.
+    if time_info:
+        dac_time = time_info.get("output_buffer_dac_time")
+        current_time = time_info.get("current_time")
+        if dac_time and current_time:
+            return max(0, dac_time - current_time)
+    try:
+        return audio_stream.get_output_latency()
+    except (AttributeError, OSError):
+        return 0
+
+
+class RingBuffer:
+    # Fixed-size byte buffer between the thread reading audio from ffmpeg and
+    # PyAudio's callback thread. Writes block while the buffer is full, so
+    # ffmpeg only ever decodes a little ahead of playback; reads never block.
+    def __init__(self, capacity):
+        self.buffer = bytearray(capacity)
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+        # Set by the writer once there is no more data coming
+        self.finished = False
+        # Set by the reader to discard any further writes
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def write(self, data):
+        view = memoryview(data)
+        with self.condition:
+            while view:
+                while self.size == self.capacity and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+
+                end = (self.start + self.size) % self.capacity
+                count = min(len(view), self.capacity - self.size, self.capacity - end)
+                self.buffer[end : end + count] = view[:count]
+                self.size += count
+                view = view[count:]
+
+    def read(self, count, align=1):
+        # Return up to `count` bytes, rounded down to a multiple of `align`
+        # so that partial audio frames are never handed out.
+        with self.condition:
+            count = min(count, self.size - self.size % align)
+            first = min(count, self.capacity - self.start)
+            data = bytes(self.buffer[self.start : self.start + first])
+            data += bytes(self.buffer[: count - first])
+            self.start = (self.start + count) % self.capacity
+            self.size -= count
+            self.condition.notify_all()
+            return data
+
+    def finish(self):
+        with self.condition:
+            self.finished = True
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class TimeStretcher:
+    # Plays audio from a RingBuffer at `speed` without changing its pitch,
+    # using WSOLA (waveform similarity overlap-add). Overlapping windows are
+    # taken from the input every `speed * hop` samples and added together
+    # every `hop` samples, each shifted by up to `tolerance` samples so that
+    # it lines up with the waveform of the previous one. `speed` can be
+    # changed at any time.
+    def __init__(
+        self, buffer, channels, window=STRETCH_WINDOW, tolerance=STRETCH_TOLERANCE
+    ):
+        self.buffer = buffer
+        self.channels = channels
+        self.frame_size = channels * 2
+        self.speed = 1
+        self.hop = window // 2
+        self.tolerance = tolerance
+        # A periodic Hann window, so that windows overlapping by half add up
+        # to exactly 1
+        self.window = np.hanning(window + 1)[:window, None].astype(np.float32)
+
+        # Input samples from absolute position `input_start` onwards, and
+        # where the input ends once the buffer is finished
+        self.input = np.zeros((0, channels), dtype=np.float32)
+        self.input_start = 0
+        self.input_end = None
+
+        self.position = 0.0
+        self.previous = None
+        self.overlap = np.zeros((self.hop, channels), dtype=np.float32)
+        self.pending = bytearray()
+        self.finished = False
+
+    @property
+    def done(self):
+        return self.finished and not self.pending
+
+    def read(self, count):
+        # Return up to `count` frames of audio as bytes. Returns fewer if the
+        # buffer is waiting for more input.
+        size = count * self.frame_size
+        while len(self.pending) < size and not self.finished:
+            samples = self.next_hop()
+            if samples is None:
+                break
+            samples = np.clip(np.rint(samples), -32768, 32767).astype(np.int16)
+            self.pending += samples.tobytes()
+
+        data = bytes(self.pending[:size])
+        del self.pending[:size]
+        return data
+
+    def fill(self, end):
+        # Make sure the input is available up to absolute position `end`.
+        # Returns False if the buffer doesn't have enough data yet.
+        missing = end - (self.input_start + len(self.input))
+        if missing <= 0:
+            return True
+
+        # Checked before reading, so that no data can arrive in between
+        finished = self.buffer.finished
+        data = self.buffer.read(missing * self.frame_size, align=self.frame_size)
+        samples = np.frombuffer(data, dtype=np.int16).reshape(-1, self.channels)
+        if len(samples) < missing and finished:
+            # Pad the end of the input with silence
+            if self.input_end is None:
+                self.input_end = self.input_start + len(self.input) + len(samples)
+            samples = np.concatenate(
+                (samples, np.zeros((missing - len(samples), self.channels)))
+            )
+        self.input = np.concatenate((self.input, samples.astype(np.float32)))
+        return len(samples) >= missing
+
+    def next_hop(self):
+        # Returns the next `hop` samples of output, or None if more input is
+        # needed first
+        nominal = round(self.position)
+        if self.input_end is not None and nominal >= self.input_end:
+            self.finished = True
+            return self.overlap
+
+        window = len(self.window)
+        if self.previous is None:
+            low = high = natural = nominal
+        else:
+            low = max(nominal - self.tolerance, self.input_start)
+            high = nominal + self.tolerance
+            # Where the previous window would have continued
+            natural = self.previous + self.hop
+        if not self.fill(max(high, natural) + window):
+            return None
+
+        if self.previous is None:
+            chosen = nominal
+        elif self.speed == 1 and low <= natural <= high:
+            # Carry straight on, which reproduces the input exactly
+            chosen = natural
+        else:
+            offset = self.input_start
+            template = self.input[natural - offset : natural - offset + window]
+            candidates = self.input[low - offset : high - offset + window]
+            scores = np.correlate(
+                candidates.sum(axis=1), template.sum(axis=1), mode="valid"
+            )
+            chosen = low + int(np.argmax(scores))
+
+        start = chosen - self.input_start
+        frame = self.input[start : start + window] * self.window
+        if self.previous is None:
+            # Nothing overlaps the first half of the first window, so take it
+            # from the input as it is rather than fading it in
+            frame[: self.hop] = self.input[start : start + self.hop]
+        else:
+            frame[: self.hop] += self.overlap
+        self.overlap = frame[self.hop :]
+        self.previous = chosen
+        self.position += self.speed * self.hop
+
+        # Drop input that no later window can use
+        keep = min(chosen, round(self.position) - self.tolerance)
+        if keep > self.input_start:
+            self.input = self.input[keep - self.input_start :]
+            self.input_start = keep
+        return frame[: self.hop]
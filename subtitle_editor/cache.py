@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from .constants import CACHE_SAMPLE_SIZE, CACHE_SIZE, CACHE_VERSION
+
+
+def default_cache_dir():
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache_home, "subtitle-editor")
+
+
+class MediaCache:
+    # On-disk cache of things derived from a media file (probe results,
+    # decoded audio, ...). Entries are keyed by a cheap hash of the file's
+    # size, modification time and contents, so renamed or moved files still
+    # hit (as do copies that keep the modification time, e.g. `cp -p`), and
+    # are evicted least-recently-used first once the cache grows past
+    # `max_size` bytes.
+    def __init__(self, directory=None, max_size=CACHE_SIZE):
+        self.directory = directory or default_cache_dir()
+        self.max_size = max_size
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, path):
+        # Hash the size, mtime and a few samples of the file rather than the
+        # whole thing, which would take longer than the work we're caching.
+        stat = os.stat(path)
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+        with open(path, "rb") as fp:
+            for offset in (0, stat.st_size // 2, stat.st_size - CACHE_SAMPLE_SIZE):
+                fp.seek(max(offset, 0))
+                digest.update(fp.read(CACHE_SAMPLE_SIZE))
+        return digest.hexdigest()
+
+    def entry_path(self, key, name):
+        return os.path.join(self.directory, f"{key}.{name}.v{CACHE_VERSION}")
+
+    def get_path(self, key, name):
+        path = self.entry_path(key, name)
+        try:
+            # Mark the entry as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get_json(self, key, name):
+        path = self.get_path(key, name)
+        if path is None:
+            return None
+        try:
+            with open(path, "r") as fp:
+                return json.load(fp)
+        except ValueError:
+            return None
+
+    def put_json(self, key, name, value):
+        def write(path):
+            with open(path, "w") as fp:
+                json.dump(value, fp)
+
+        return self.store(key, name, write)
+
+    def fits(self, size):
+        # Whether an entry of `size` bytes could be kept at all
+        return size <= self.max_size
+
+    def store(self, key, name, write):
+        # Call `write` with a temporary path and move the result into place
+        # once it's complete, so a cancelled write never leaves a partial
+        # entry behind.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            write(tmp_path)
+            path = self.entry_path(key, name)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self.evict()
+        return path
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,157 @@
+import json
+import os
+import statistics
+import time
+
+import numpy as np
+import pyaudio
+
+from .audio import output_latency
+from .constants import (
+    AUDIO_CHANNELS,
+    AUDIO_FRAME_SIZE,
+    AUDIO_RATE,
+    AUDIO_SAMPLE_WIDTH,
+    CALIBRATION_BEEPS,
+    CALIBRATION_LEAD_IN,
+    CALIBRATION_MAX_INTERVAL,
+    CALIBRATION_MIN_INTERVAL,
+)
+
+BEEP_SECONDS = 0.05
+BEEP_FREQUENCY = 1000
+
+
+def default_settings_path():
+    config_home = os.environ.get("XDG_CONFIG_HOME") or os.path.join(
+        os.path.expanduser("~"), ".config"
+    )
+    return os.path.join(config_home, "subtitle-editor", "settings.json")
+
+
+def load_tap_offset(path=None):
+    # Seconds between hearing something and the editor receiving the key
+    # pressed in response, as measured by the last calibration
+    try:
+        with open(path or default_settings_path(), "r") as fp:
+            return float(json.load(fp).get("tap_offset", 0))
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def save_tap_offset(offset, path=None):
+    path = path or default_settings_path()
+    try:
+        with open(path, "r") as fp:
+            settings = json.load(fp)
+    except (OSError, ValueError):
+        settings = {}
+    settings["tap_offset"] = offset
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as fp:
+        json.dump(settings, fp)
+
+
+def beep_times(beeps, min_interval, max_interval, lead_in, rng=None):
+    # Seconds into the track of each beep: the first after `lead_in`, then at
+    # random intervals so that the user can't fall into a rhythm and tap
+    # along with it instead of reacting
+    rng = rng or np.random.default_rng()
+    gaps = rng.uniform(min_interval, max_interval, beeps - 1)
+    return lead_in + np.concatenate(([0], np.cumsum(gaps)))
+
+
+def beep_track(times):
+    # Silence with a short beep at each of `times` seconds
+    t = np.arange(round(BEEP_SECONDS * AUDIO_RATE)) / AUDIO_RATE
+    # Fade in and out to avoid clicks
+    beep = np.sin(2 * np.pi * BEEP_FREQUENCY * t) * np.hanning(len(t)) * 16000
+    length = round(max(times, default=0) * AUDIO_RATE) + len(beep)
+    # Leave some silence for the last tap
+    length += round(CALIBRATION_MIN_INTERVAL * AUDIO_RATE)
+    track = np.zeros(length, dtype=np.float32)
+    for seconds in times:
+        start = round(seconds * AUDIO_RATE)
+        track[start : start + len(beep)] = beep
+    return np.repeat(track[:, None], AUDIO_CHANNELS, axis=1).astype(np.int16).tobytes()
+
+
+class Calibration:
+    # A short tap-along: beeps are played at unpredictable intervals and the
+    # user presses a key as soon as they hear each one. How late the key
+    # presses arrive after each beep is actually heard covers their reaction
+    # time and the input pipeline (terminal, curses, event loop), while the
+    # audio output latency is measured separately from PortAudio's timing
+    # information.
+    def __init__(
+        self,
+        beeps=CALIBRATION_BEEPS,
+        min_interval=CALIBRATION_MIN_INTERVAL,
+        max_interval=CALIBRATION_MAX_INTERVAL,
+        lead_in=CALIBRATION_LEAD_IN,
+    ):
+        self.beeps = beeps
+        self.beep_times = beep_times(beeps, min_interval, max_interval, lead_in)
+        self.track = beep_track(self.beep_times)
+        self.position = 0
+        # time.monotonic() at which the start of the track is heard
+        self.heard_at = None
+        self.taps = []
+
+        self.pyaudio = None
+        self.audio_stream = None
+
+    @property
+    def duration(self):
+        return len(self.track) / AUDIO_FRAME_SIZE / AUDIO_RATE
+
+    def start(self, audio_interface=pyaudio.PyAudio):
+        self.pyaudio = audio_interface()
+        self.audio_stream = self.pyaudio.open(
+            format=self.pyaudio.get_format_from_width(AUDIO_SAMPLE_WIDTH),
+            channels=AUDIO_CHANNELS,
+            rate=AUDIO_RATE,
+            output=True,
+            stream_callback=self._audio_callback,
+        )
+
+    def _audio_callback(self, in_data, frame_count, time_info, status):
+        if self.heard_at is None:
+            self.heard_at = time.monotonic() + output_latency(
+                self.audio_stream, time_info
+            )
+
+        size = frame_count * AUDIO_FRAME_SIZE
+        data = self.track[self.position : self.position + size]
+        self.position += size
+        if len(data) < size:
+            return data + bytes(size - len(data)), pyaudio.paComplete
+        return data, pyaudio.paContinue
+
+    def tap(self):
+        self.taps.append(time.monotonic())
+
+    def offset(self):
+        # Median delay between hearing a beep and the tap for it, or None if
+        # the user didn't react to at least half of the beeps. Each tap is
+        # matched with the nearest beep, and only the first tap for each beep
+        # counts.
+        if self.heard_at is None:
+            return None
+
+        heard = self.heard_at + self.beep_times
+        delays = {}
+        for tap in self.taps:
+            number = int(np.argmin(np.abs(heard - tap)))
+            delays.setdefault(number, tap - heard[number])
+        if len(delays) < self.beeps / 2:
+            return None
+        return statistics.median(delays.values())
+
+    def stop(self):
+        if self.audio_stream is not None:
+            self.audio_stream.stop_stream()
+            self.audio_stream.close()
+        if self.pyaudio is not None:
+            self.pyaudio.terminate()
@@ -1,228 +1,101 @@
 import curses
-import math
+import os
 from datetime import timedelta
 
 import click
+import ffmpeg
 import srt
 
-from .colors import Pairs, setup_colors
-from .constants import UNSET_TIME
-from .subtitles.srt import SubtitlePad
-from .video import Video
-
-EDITOR_HELP = """
-NAVIGATION
-<tab>/←/→ Switch between start/end timestamps
-↑/↓       Select a subtitle
-=/+       Increase the selected timestamp by one frame / 1 sec
--/_       Decrease the selected timestamp by one frame / 1 sec
-
-PLAYBACK
-P         Enter / leave playback mode
-<space>   In playback mode, set the current timestamp and move to the next one
-p         In standard mode, play the video between the start/end timestamps of the current subtitle
-
-OTHER
-q         Save and exit
-Ctrl + c  Exit without saving
-?         Display this message
-"""
-
-TIMESTAMP_STRING = "00:00:00,000 --> 00:00:00,000"
-STANDARD_STATUS_BAR = "↑/↓/←/→: navigate  +/-: adjust time  p/P: playback ?: help"
-STANDARD_STATUS_BAR_SHORT = "↑/↓/←/→   +/-   p/P  ?: help"
-PLAYBACK_STATUS_BAR = (
-    "p: pause  <space>: set & go to next  <tab>: toggle start/end  ?: help"
-)
-PLAYBACK_STATUS_BAR_SHORT = "p  <space>  <tab>  ?: help"
-
-NAVIGATION_COMMANDS = frozenset(
-    (
-        "KEY_UP",
-        "KEY_DOWN",
-        "\t",
-        "KEY_LEFT",
-        "KEY_RIGHT",
-        "=",
-        "+",
-        "-",
-        "_",
-    )
-)
-
-TOGGLE_COMMANDS = frozenset(
-    (
-        "\t",
-        "KEY_LEFT",
-        "KEY_RIGHT",
-    )
+from .align import align
+from .cache import MediaCache
+from .constants import (
+    CACHE_SIZE,
+    EXPORT_CRF,
+    EXPORT_PRESET,
+    EXPORT_SEGMENT_SECONDS,
+    UNDO_LIMIT,
+    UNSET_TIME,
 )
+from .editor import Editor
+from .export import export as export_video
+from .subtitles.session import load_session, save_session
+from .subtitles.srt_format import compose, parse_file
 
 
-def handle_navigation_cmd(cmd, subtitle_pad, video):
-    if cmd == "KEY_UP":
-        subtitle_pad.previous()
-    elif cmd == "KEY_DOWN":
-        subtitle_pad.next()
-    elif cmd in TOGGLE_COMMANDS:
-        subtitle_pad.toggle_selected_timestamp()
-    elif cmd == "=":
-        subtitle_pad.set_frame(subtitle_pad.get_frame() + 1)
-    elif cmd == "+":
-        subtitle_pad.set_frame(subtitle_pad.get_frame() + math.floor(subtitle_pad.fps))
-    elif cmd == "-":
-        subtitle_pad.set_frame(subtitle_pad.get_frame() - 1)
-    elif cmd == "_":
-        subtitle_pad.set_frame(subtitle_pad.get_frame() - math.floor(subtitle_pad.fps))
-
-    video.display_frame(subtitle_pad.get_frame())
-
-
-def display_help(stdscr, video, subtitle_pad, help_text):
-    stdscr.erase()
-    stdscr.addstr(0, 0, EDITOR_HELP)
-    stdscr.addstr(
-        curses.LINES - 1,
-        0,
-        "Press any key to continue...".ljust(curses.COLS - 1),
-        curses.color_pair(Pairs.STATUS),
-    )
-    stdscr.getkey()
-    stdscr.erase()
-    subtitle_pad.should_render = True
-    video.should_render = True
-    stdscr.noutrefresh()
-
-
-def run_playback_mode(stdscr, video, subtitle_pad, start_frame, end_frame):
-    stdscr.nodelay(True)
-    status_bar = (
-        PLAYBACK_STATUS_BAR
-        if curses.COLS >= len(PLAYBACK_STATUS_BAR)
-        else PLAYBACK_STATUS_BAR_SHORT
+def run_editor(stdscr, subtitles, video_path, undo_limit, cache, session):
+    editor = Editor(
+        stdscr, subtitles, video_path, undo_limit, cache=cache, session=session
     )
-    stdscr.addstr(
-        curses.LINES - 1,
-        0,
-        status_bar.ljust(curses.COLS - 1),
-        curses.color_pair(Pairs.STATUS),
-    )
-
-    cmd = ""
-    for frame_num in video.play(start_frame, end_frame):
-
-        current_ts = timedelta(seconds=frame_num / video.fps)
-        stdscr.addstr(
-            1,
-            0,
-            srt.timedelta_to_srt_timestamp(current_ts),
+    editor.run()
+    return editor
+
+
+def load_subtitles(path, consequence):
+    # `consequence` says what happens to malformed subtitles, e.g. "will be
+    # removed when saving"
+    subs, errors = parse_file(path)
+    if errors:
+        for line_number, message in errors:
+            click.echo(f"{path}:{line_number}: {message}", err=True)
+        click.confirm(
+            f"{len(errors)} malformed subtitle(s) {consequence}. Continue?",
+            abort=True,
         )
-        subtitle_pad.set_playback_frame(frame_num)
-        subtitle_pad.render()
-        curses.doupdate()
-
-        try:
-            cmd = stdscr.getkey()
-        except curses.error:
-            continue
-
-        if cmd == "?":
-            stdscr.nodelay(False)
-            display_help(stdscr, video, subtitle_pad, EDITOR_HELP)
-            stdscr.nodelay(True)
-        elif cmd == " ":
-            subtitle_pad.set_frame(frame_num, progress=True)
-        elif cmd in TOGGLE_COMMANDS:
-            # Allow toggling so that users can move on from a start
-            # timestamp without setting it.
-            subtitle_pad.toggle_selected_timestamp()
-        elif cmd in ("P", "p", "q"):
-            break
-
-    stdscr.nodelay(False)
-    video.set_current_frame(subtitle_pad.get_frame())
-    subtitle_pad.set_playback_frame(None)
-
-    stdscr.addstr(
-        1,
-        0,
-        " " * curses.COLS,
-    )
+    return subs
 
 
-def run_editor(stdscr, subtitles, video_path):
-    curses.curs_set(0)
-    min_cols = 1 + max(
-        len(STANDARD_STATUS_BAR_SHORT),
-        len(PLAYBACK_STATUS_BAR_SHORT),
-        len(TIMESTAMP_STRING),
-    )
-    if curses.COLS < min_cols:
-        raise click.ClickException(
-            f"Window must be at least {min_cols} columns wide (currently {curses.COLS})"
-        )
+class DefaultGroup(click.Group):
+    # Runs the editor when the first argument isn't a subcommand, so that
+    # `subtitle-editor video.mp4 subtitles.srt` keeps working.
+    default_command = "edit"
 
-    # Set up ANSI colors
-    setup_colors()
+    def parse_args(self, ctx, args):
+        if args and args[0] not in self.commands and args[0] != "--help":
+            args.insert(0, self.default_command)
+        return super().parse_args(ctx, args)
 
-    video = Video(video_path)
-    subtitle_pad = SubtitlePad(
-        subtitles, 2, curses.LINES - 2, curses.COLS, fps=video.fps
-    )
-    subtitle_pad.init_pad()
 
-    video.set_current_frame(subtitle_pad.get_frame())
+@click.group(cls=DefaultGroup)
+def cli():
+    pass
 
-    cmd = None
 
-    while cmd != "q":
-        status_bar = (
-            STANDARD_STATUS_BAR
-            if curses.COLS >= len(STANDARD_STATUS_BAR)
-            else STANDARD_STATUS_BAR_SHORT
-        )
-        stdscr.addstr(
-            curses.LINES - 1,
-            0,
-            status_bar.ljust(curses.COLS - 1),
-            curses.color_pair(Pairs.STATUS),
-        )
-        stdscr.noutrefresh()
-        subtitle_pad.render()
-        curses.doupdate()
-        cmd = stdscr.getkey()
-        if cmd in NAVIGATION_COMMANDS:
-            handle_navigation_cmd(cmd, subtitle_pad, video)
-        elif cmd == "?":
-            display_help(stdscr, video, subtitle_pad, EDITOR_HELP)
-        elif cmd == "p":
-            # Play just the video behind the current subtitle
-            subtitle = subtitle_pad.get_selected_subtitle()
-            run_playback_mode(
-                stdscr,
-                video,
-                subtitle_pad,
-                start_frame=subtitle.get_start(),
-                end_frame=subtitle.get_end(),
-            )
-        elif cmd == "P":
-            # Start at the current subtitle and continue to the
-            # end of the video
-            subtitle = subtitle_pad.get_selected_subtitle()
-            run_playback_mode(
-                stdscr,
-                video,
-                subtitle_pad,
-                start_frame=subtitle.get_start(),
-                end_frame=video.frame_count - 1,
-            )
-
-
-@click.command()
+@cli.command(help="Edit the timing of a subtitle file (the default command).")
 @click.argument("video", type=click.Path(exists=True))
 @click.argument("subtitles", type=click.Path())
 @click.option("-i", "--input", "input_", type=click.Path(exists=True))
-def cli(video, subtitles, input_):
+@click.option(
+    "--align/--no-align",
+    "align_",
+    default=True,
+    show_default=True,
+    help="With --input, estimate timestamps from the speech in the video",
+)
+@click.option(
+    "--undo-limit",
+    type=click.IntRange(min=1),
+    default=UNDO_LIMIT,
+    show_default=True,
+    help="Number of changes that can be undone",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False),
+    help="Where to cache data derived from the video  [default: ~/.cache/subtitle-editor]",
+)
+@click.option(
+    "--cache-size",
+    type=click.IntRange(min=0),
+    default=CACHE_SIZE // 1024 ** 2,
+    show_default=True,
+    help="Maximum size of the cache in MB. Set to 0 to disable caching",
+)
+def edit(video, subtitles, input_, align_, undo_limit, cache_dir, cache_size):
+    cache = None
+    if cache_size:
+        cache = MediaCache(cache_dir, max_size=cache_size * 1024 ** 2)
+
+    session = None
     if input_:
         # For plain-input files, each line is a subtitle that needs a time associated
         with open(input_, "r") as fp:
@@ -230,14 +103,76 @@ def cli(video, subtitles, input_):
                 srt.Subtitle(i + 1, UNSET_TIME, UNSET_TIME, line)
                 for i, line in enumerate(filter(lambda l: l.strip(), fp))
             ]
-    else:
-        with open(subtitles, "r") as fp:
+        if align_:
+            # Pre-fill a rough cut from the speech in the audio track
+            click.echo("Aligning subtitles to the audio...")
             try:
-                subs = list(srt.parse(fp))
-            except srt.SRTParseError:
-                raise click.ClickException("Could not parse srt file.")
+                times = align(video, [sub.content for sub in subs], cache=cache)
+            except ffmpeg.Error:
+                # e.g. no audio track. The subtitles are left without times.
+                click.echo("Could not align the subtitles to the audio.", err=True)
+                times = []
+            for sub, (start, end) in zip(subs, times):
+                if start is not None:
+                    sub.start = timedelta(seconds=start)
+                    sub.end = timedelta(seconds=end)
+    else:
+        # Reopening a file saved by the editor doesn't need to parse it
+        session = load_session(subtitles)
+        if session is not None:
+            subs = session.subtitles()
+        else:
+            subs = load_subtitles(subtitles, "will be removed when saving")
 
-    curses.wrapper(run_editor, subs, video)
+    editor = curses.wrapper(run_editor, subs, video, undo_limit, cache, session)
 
-    with open(subtitles, "w") as fp:
-        fp.write(srt.compose(subs))
+    written = []
+    data = compose(subs, written).encode("utf-8")
+    with open(subtitles, "wb") as fp:
+        fp.write(data)
+    save_session(subtitles, data, written, editor.subtitle_pad)
+
+
+@cli.command(help="Render a preview of the video with the subtitles burned in.")
+@click.argument("video", type=click.Path(exists=True))
+@click.argument("subtitles", type=click.Path(exists=True))
+@click.argument("output", type=click.Path())
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=os.cpu_count() or 1,
+    show_default=True,
+    help="Number of segments to encode in parallel",
+)
+@click.option(
+    "--segment-length",
+    type=click.FloatRange(min=1),
+    default=EXPORT_SEGMENT_SECONDS,
+    show_default=True,
+    help="Minimum length of each segment in seconds",
+)
+@click.option(
+    "--crf",
+    type=click.IntRange(min=0, max=51),
+    default=EXPORT_CRF,
+    show_default=True,
+    help="x264 quality (lower is better)",
+)
+@click.option(
+    "--preset",
+    default=EXPORT_PRESET,
+    show_default=True,
+    help="x264 preset",
+)
+def export(video, subtitles, output, jobs, segment_length, crf, preset):
+    subs = load_subtitles(subtitles, "will be left out of the preview")
+    try:
+        export_video(video, subs, output, jobs, segment_length, crf, preset)
+    except StopIteration:
+        raise click.ClickException(f"{video} has no video stream.")
+    except ffmpeg.Error as error:
+        # The last thing ffmpeg printed is usually the reason it failed
+        lines = (error.stderr or b"").decode(errors="replace").strip().splitlines()
+        reason = f": {lines[-1]}" if lines else "."
+        raise click.ClickException(f"Could not export the video{reason}")
@@ -7,6 +7,9 @@ class Pairs(enum.IntEnum):
     # without disrupting video coloring
     STATUS = 233
     DIM_STANDOUT = 235
+    WARNING = 237
+    MINIMAP = 239
+    MINIMAP_WARNING = 241
 
     # Use an actual greyscale for this because it works.
     DIM = 242
@@ -290,3 +293,6 @@ def setup_colors():
     # Use odd numbers above 232 available for custom color pairs
     curses.init_pair(Pairs.STATUS, 15, 12)
     curses.init_pair(Pairs.DIM_STANDOUT, 232, Pairs.DIM)
+    curses.init_pair(Pairs.WARNING, 15, 9)
+    curses.init_pair(Pairs.MINIMAP, 252, 236)
+    curses.init_pair(Pairs.MINIMAP_WARNING, 9, 236)
@@ -2,3 +2,79 @@ from datetime import timedelta
 
 UNSET_TIME = timedelta(-1)
 UNSET_FRAME = -2
+
+# Shortest duration and smallest gap between subtitles that are not flagged as
+# problems by the validator.
+MIN_DURATION = timedelta(milliseconds=833)
+MIN_GAP_FRAMES = 2
+
+# Number of edits that can be undone
+UNDO_LIMIT = 10000
+
+# Format of the raw PCM audio streamed from ffmpeg during playback
+AUDIO_RATE = 44100
+AUDIO_CHANNELS = 2
+AUDIO_SAMPLE_WIDTH = 2
+AUDIO_FRAME_SIZE = AUDIO_CHANNELS * AUDIO_SAMPLE_WIDTH
+# Bytes read from ffmpeg at a time, and how far ahead of playback it may decode
+AUDIO_CHUNK_SIZE = 4096
+AUDIO_BUFFER_SECONDS = 2
+# Time-stretching for playback at other speeds works on overlapping windows of
+# STRETCH_WINDOW samples, each shifted by up to STRETCH_TOLERANCE samples to
+# line up with the previous one
+STRETCH_WINDOW = 2048
+STRETCH_TOLERANCE = 512
+
+PLAYBACK_SPEEDS = (0.5, 1, 1.25, 1.5, 2)
+# How soon to try again when the next frame hasn't been decoded in time
+PLAYBACK_RETRY_SECONDS = 0.005
+
+# Calibration of the <space> key: CALIBRATION_BEEPS beeps at random intervals
+# between CALIBRATION_MIN_INTERVAL and CALIBRATION_MAX_INTERVAL seconds (so
+# that they can't be anticipated), after CALIBRATION_LEAD_IN seconds of silence
+CALIBRATION_BEEPS = 8
+CALIBRATION_MIN_INTERVAL = 0.8
+CALIBRATION_MAX_INTERVAL = 2.2
+CALIBRATION_LEAD_IN = 1.5
+
+# Number of decoded frames the frame server can hand out at once, which is also
+# how far ahead of playback it may decode
+FRAME_SERVER_SLOTS = 8
+# Skipping ahead by up to this many frames grabs them rather than seeking
+FRAME_SERVER_MAX_GRAB = 30
+
+# Number of rasterized subtitles kept for drawing onto video frames
+OVERLAY_CACHE_SIZE = 64
+
+# Session snapshots saved next to subtitle files. Bump SESSION_VERSION whenever
+# their format changes.
+SESSION_VERSION = 1
+
+# Media cache. Bump CACHE_VERSION whenever the format of a cached entry changes.
+CACHE_VERSION = 1
+CACHE_SIZE = 2 * 1024 ** 3
+CACHE_SAMPLE_SIZE = 64 * 1024
+
+# Automatic alignment of plain-text input. Audio is analysed as mono PCM at
+# ALIGN_RATE in windows of ALIGN_WINDOW_SECONDS.
+ALIGN_RATE = 16000
+ALIGN_WINDOW_SECONDS = 0.01
+# Silences shorter than this are bridged, and speech shorter than this dropped
+ALIGN_MIN_GAP_SECONDS = 0.3
+ALIGN_MIN_SPEECH_SECONDS = 0.15
+# Speech regions are split into units of at most this length
+ALIGN_MAX_UNIT_SECONDS = 1.0
+ALIGN_MAX_LINE_SECONDS = 10
+# Cost per second of speech that isn't assigned to any line
+ALIGN_SKIP_PENALTY = 0.5
+# Cost of starting or ending a line in the middle of a speech region
+ALIGN_CUT_PENALTY = 1.0
+# Times the lines are assigned again with expected durations from the speech
+# that was actually assigned, leaving out music and noise
+ALIGN_REFINE_PASSES = 3
+
+# Burned-in preview export. The video is split into segments of at least
+# EXPORT_SEGMENT_SECONDS (starting on keyframes) which are encoded in parallel.
+EXPORT_SEGMENT_SECONDS = 30
+EXPORT_CRF = 20
+EXPORT_PRESET = "veryfast"
@@ -0,0 +1,551 @@
+import curses
+import math
+import sys
+import time
+from datetime import timedelta
+
+import click
+import srt
+
+from .calibration import Calibration, load_tap_offset, save_tap_offset
+from .colors import Pairs, setup_colors
+from .constants import PLAYBACK_RETRY_SECONDS, PLAYBACK_SPEEDS
+from .events import EventLoop
+from .subtitles.srt import SubtitlePad
+from .video import Video
+
+EDITOR_HELP = """
+NAVIGATION
+<tab>/←/→ Switch between start/end timestamps
+↑/↓       Select a subtitle
+=/+       Increase the selected timestamp by one frame / 1 sec
+-/_       Decrease the selected timestamp by one frame / 1 sec
+n         Jump to the next subtitle with a timing problem
+g         Choose a position on the timeline and jump to the subtitle there
+u/r       Undo / redo the last change to a timestamp
+
+PLAYBACK
+P         Enter / leave playback mode
+<space>   In playback mode, set the current timestamp and move to the next one
+p         In standard mode, play the video between the start/end timestamps of the current subtitle
+[/]       In playback mode, slow down / speed up playback (0.5x to 2x)
+c         Calibrate <space> by tapping along with a few beeps
+
+OTHER
+q         Save and exit
+Ctrl + c  Exit without saving
+?         Display this message
+"""
+
+TIMESTAMP_STRING = "00:00:00,000 --> 00:00:00,000"
+STANDARD_STATUS_BAR = "↑/↓/←/→: navigate  +/-: adjust time  p/P: playback ?: help"
+STANDARD_STATUS_BAR_SHORT = "↑/↓/←/→   +/-   p/P  ?: help"
+PLAYBACK_STATUS_BAR = (
+    "p: pause  <space>: set & go to next  <tab>: toggle start/end  [/]: speed  ?: help"
+)
+PLAYBACK_STATUS_BAR_SHORT = "p  <space>  <tab>  [/]  ?: help"
+HELP_STATUS_BAR = "Press any key to continue..."
+MINIMAP_STATUS_BAR = "←/→: choose position  <enter>: jump  any other key: cancel"
+
+NAVIGATION_COMMANDS = frozenset(
+    (
+        "KEY_UP",
+        "KEY_DOWN",
+        "\t",
+        "KEY_LEFT",
+        "KEY_RIGHT",
+        "=",
+        "+",
+        "-",
+        "_",
+        "n",
+        "u",
+        "r",
+    )
+)
+
+TOGGLE_COMMANDS = frozenset(
+    (
+        "\t",
+        "KEY_LEFT",
+        "KEY_RIGHT",
+    )
+)
+
+
+class Editor:
+    # The editor is driven by an event loop that multiplexes keyboard input,
+    # decoded frames from the frame server, audio extraction and playback
+    # timers, so that no single operation can freeze the UI.
+    def __init__(
+        self, stdscr, subtitles, video_path, undo_limit, cache=None, session=None
+    ):
+        min_cols = 1 + max(
+            len(STANDARD_STATUS_BAR_SHORT),
+            len(PLAYBACK_STATUS_BAR_SHORT),
+            len(TIMESTAMP_STRING),
+        )
+        if curses.COLS < min_cols:
+            raise click.ClickException(
+                f"Window must be at least {min_cols} columns wide (currently {curses.COLS})"
+            )
+
+        self.stdscr = stdscr
+        self.loop = EventLoop()
+        self.video = Video(video_path, cache=cache)
+        self.subtitle_pad = SubtitlePad(
+            subtitles,
+            2,
+            curses.LINES - 3,
+            curses.COLS,
+            fps=self.video.fps,
+            frame_count=self.video.frame_count,
+            undo_limit=undo_limit,
+            session=session,
+        )
+        self.video.subtitles_at = self.subtitle_pad.get_text_at
+
+        self.showing_help = False
+        # Transient message that replaces the status bar, e.g. progress
+        self.status = None
+        # Column chosen on the minimap when jumping with g, and the column
+        # highlighted on the minimap as last drawn
+        self.minimap_cursor = None
+        self.rendered_marker = None
+
+        self.playback = None
+        self.playback_frame = None
+        self.playback_timer = None
+        # Contents of the playback timestamp line as last drawn
+        self.rendered_timestamp = None
+        # Frame at which the subtitles drawn on the video next change, once
+        # they've been rasterized ahead of time
+        self.prefetched_frame = None
+        # Kept between playbacks
+        self.playback_speed = 1
+
+        # Seconds between hearing something and the key pressed in response
+        # arriving, which is taken off timestamps set with <space>
+        self.tap_offset = load_tap_offset()
+        self.calibration = None
+        self.calibration_timer = None
+        self.status_timer = None
+
+    def run(self):
+        curses.curs_set(0)
+        # Set up ANSI colors
+        setup_colors()
+
+        self.subtitle_pad.init_pad()
+
+        self.stdscr.nodelay(True)
+        self.loop.add_reader(sys.stdin, self.handle_input)
+        self.loop.add_reader(self.video.frames, self.handle_frames)
+        self.loop.run_in_background(self.video.cache_audio, callback=self.audio_cached)
+        self.render()
+        try:
+            self.loop.run()
+        finally:
+            if self.calibration is not None:
+                self.calibration.stop()
+            self.stop_playback()
+            self.video.close()
+            self.loop.close()
+
+    def audio_cached(self, future):
+        # Playback still works without the cache, by decoding as it goes
+        if future.exception() is not None:
+            self.flash_status("Could not cache the audio track")
+
+    def render(self):
+        if self.showing_help:
+            return
+
+        if self.status is not None:
+            status_bar = self.status
+        elif self.playback is not None:
+            status_bar = (
+                PLAYBACK_STATUS_BAR
+                if curses.COLS >= len(PLAYBACK_STATUS_BAR)
+                else PLAYBACK_STATUS_BAR_SHORT
+            )
+        else:
+            status_bar = (
+                STANDARD_STATUS_BAR
+                if curses.COLS >= len(STANDARD_STATUS_BAR)
+                else STANDARD_STATUS_BAR_SHORT
+            )
+        self.stdscr.addstr(
+            curses.LINES - 1,
+            0,
+            status_bar[: curses.COLS - 1].ljust(curses.COLS - 1),
+            curses.color_pair(Pairs.STATUS),
+        )
+        self.render_minimap()
+
+        if self.playback_frame is not None:
+            self.rendered_timestamp = self.playback_timestamp()
+            self.stdscr.addstr(1, 0, self.rendered_timestamp)
+
+        self.stdscr.noutrefresh()
+        self.subtitle_pad.render()
+        curses.doupdate()
+
+    def playback_timestamp(self):
+        current_ts = timedelta(seconds=self.playback_frame / self.video.fps)
+        return (
+            f"{srt.timedelta_to_srt_timestamp(current_ts)} "
+            f"{self.playback_speed:>5g}x"
+        )
+
+    def render_playback_frame(self):
+        # Called for every frame during playback, so only touch the terminal
+        # for what has actually changed. Usually that's just the timestamp
+        # line, which is updated in place.
+        if self.subtitle_pad.should_render:
+            self.render()
+            return
+
+        changed = False
+        timestamp = self.playback_timestamp()
+        if timestamp != self.rendered_timestamp:
+            self.rendered_timestamp = timestamp
+            self.stdscr.addstr(1, 0, timestamp)
+            changed = True
+        if self.minimap_marker() != self.rendered_marker:
+            self.render_minimap()
+            changed = True
+        if changed:
+            self.stdscr.refresh()
+
+    def minimap_marker(self):
+        # Column to highlight on the minimap: the position being chosen with
+        # g, otherwise the playback position or the selected timestamp
+        if self.minimap_cursor is not None:
+            return self.minimap_cursor
+        if self.playback_frame is not None:
+            frame = self.playback_frame
+        else:
+            frame = self.subtitle_pad.get_frame()
+        return self.subtitle_pad.minimap.column(frame)
+
+    def render_minimap(self):
+        self.rendered_marker = self.minimap_marker()
+        self.subtitle_pad.minimap.render(
+            self.stdscr, curses.LINES - 2, self.rendered_marker
+        )
+
+    def set_status(self, status):
+        self.status = status
+        self.render()
+
+    def flash_status(self, status, seconds=3):
+        # Show a message in the status bar for a few seconds
+        self.loop.cancel(self.status_timer)
+        self.set_status(status)
+
+        def clear():
+            self.status_timer = None
+            if self.status == status:
+                self.set_status(None)
+
+        self.status_timer = self.loop.call_later(seconds, clear)
+
+    def handle_input(self):
+        while self.loop.running:
+            try:
+                cmd = self.stdscr.getkey()
+            except curses.error:
+                break
+            self.handle_cmd(cmd)
+        self.render()
+
+    def handle_cmd(self, cmd):
+        if self.showing_help:
+            self.hide_help()
+        elif self.calibration is not None:
+            if cmd == " ":
+                self.calibration.tap()
+            elif cmd == "q":
+                self.finish_calibration(cancel=True)
+        elif self.minimap_cursor is not None:
+            self.handle_minimap_cmd(cmd)
+        elif cmd == "?":
+            self.show_help()
+        elif self.playback is not None:
+            self.handle_playback_cmd(cmd)
+        elif cmd == "q":
+            self.loop.stop()
+        elif cmd in NAVIGATION_COMMANDS:
+            self.handle_navigation_cmd(cmd)
+        elif cmd == "p":
+            # Play just the video behind the current subtitle
+            subtitle = self.subtitle_pad.get_selected_subtitle()
+            self.start_playback(
+                start_frame=subtitle.get_start(),
+                end_frame=subtitle.get_end(),
+            )
+        elif cmd == "P":
+            # Start at the current subtitle and continue to the
+            # end of the video
+            subtitle = self.subtitle_pad.get_selected_subtitle()
+            self.start_playback(
+                start_frame=subtitle.get_start(),
+                end_frame=self.video.frame_count - 1,
+            )
+        elif cmd == "c":
+            self.start_calibration()
+        elif cmd == "g":
+            self.minimap_cursor = self.minimap_marker() or 0
+            self.status = MINIMAP_STATUS_BAR
+
+    def handle_navigation_cmd(self, cmd):
+        subtitle_pad = self.subtitle_pad
+        if cmd == "KEY_UP":
+            subtitle_pad.previous()
+        elif cmd == "KEY_DOWN":
+            subtitle_pad.next()
+        elif cmd in TOGGLE_COMMANDS:
+            subtitle_pad.toggle_selected_timestamp()
+        elif cmd == "=":
+            subtitle_pad.set_frame(subtitle_pad.get_frame() + 1)
+        elif cmd == "+":
+            subtitle_pad.set_frame(
+                subtitle_pad.get_frame() + math.floor(subtitle_pad.fps)
+            )
+        elif cmd == "-":
+            subtitle_pad.set_frame(subtitle_pad.get_frame() - 1)
+        elif cmd == "_":
+            subtitle_pad.set_frame(
+                subtitle_pad.get_frame() - math.floor(subtitle_pad.fps)
+            )
+        elif cmd == "n":
+            subtitle_pad.next_problem()
+        elif cmd == "u":
+            subtitle_pad.undo()
+        elif cmd == "r":
+            subtitle_pad.redo()
+
+        self.display_frame(subtitle_pad.get_frame())
+
+    def handle_minimap_cmd(self, cmd):
+        minimap = self.subtitle_pad.minimap
+        if cmd == "KEY_LEFT":
+            self.minimap_cursor = max(self.minimap_cursor - 1, 0)
+        elif cmd == "KEY_RIGHT":
+            self.minimap_cursor = min(self.minimap_cursor + 1, minimap.width - 1)
+        else:
+            if cmd in ("\n", "KEY_ENTER"):
+                index = minimap.subtitle_at(self.minimap_cursor)
+                if index is not None:
+                    self.subtitle_pad.select(index)
+                    self.display_frame(self.subtitle_pad.get_frame())
+            self.minimap_cursor = None
+            self.status = None
+
+    def handle_playback_cmd(self, cmd):
+        if cmd == " ":
+            if self.playback_frame is not None:
+                # Use the frame that was being heard when the user reacted,
+                # rather than whichever frame is showing now
+                frame = self.playback.frame_at(time.monotonic() - self.tap_offset)
+                self.subtitle_pad.set_frame(frame, progress=True)
+        elif cmd == "u":
+            self.subtitle_pad.undo()
+        elif cmd in ("[", "]"):
+            self.change_speed(1 if cmd == "]" else -1)
+        elif cmd in TOGGLE_COMMANDS:
+            # Allow toggling so that users can move on from a start
+            # timestamp without setting it.
+            self.subtitle_pad.toggle_selected_timestamp()
+        elif cmd in ("P", "p", "q"):
+            self.stop_playback()
+
+    def change_speed(self, direction):
+        index = PLAYBACK_SPEEDS.index(self.playback_speed) + direction
+        if not 0 <= index < len(PLAYBACK_SPEEDS):
+            return
+
+        self.playback_speed = PLAYBACK_SPEEDS[index]
+        self.playback.set_speed(self.playback_speed)
+        if self.playback_timer is not None:
+            # Show the next frame on the new schedule
+            self.loop.cancel(self.playback_timer)
+            self.schedule_playback_frame()
+
+    def start_calibration(self):
+        self.calibration = Calibration()
+        try:
+            self.calibration.start()
+        except OSError:
+            self.calibration = None
+            self.flash_status("Could not play audio")
+            return
+        self.set_status(
+            f"Press <space> as soon as you hear each of the "
+            f"{self.calibration.beeps} beeps (q: cancel)"
+        )
+        self.calibration_timer = self.loop.call_later(
+            self.calibration.duration + 0.5, self.finish_calibration
+        )
+
+    def finish_calibration(self, cancel=False):
+        calibration, self.calibration = self.calibration, None
+        self.loop.cancel(self.calibration_timer)
+        calibration.stop()
+        if cancel:
+            self.set_status(None)
+            return
+
+        offset = calibration.offset()
+        if offset is None:
+            self.flash_status("Calibration failed: press <space> on each beep")
+            return
+        self.tap_offset = offset
+        try:
+            save_tap_offset(offset)
+        except OSError:
+            # Still used until the editor is closed
+            self.flash_status(
+                f"<space> will be {offset * 1000:.0f} ms earlier "
+                "(could not save it for next time)"
+            )
+            return
+        self.flash_status(f"<space> will be {offset * 1000:.0f} ms earlier")
+
+    def show_help(self):
+        self.showing_help = True
+        if self.playback is not None:
+            self.playback.pause()
+            self.loop.cancel(self.playback_timer)
+            self.playback_timer = None
+
+        self.stdscr.erase()
+        self.stdscr.addstr(0, 0, EDITOR_HELP)
+        self.stdscr.addstr(
+            curses.LINES - 1,
+            0,
+            HELP_STATUS_BAR.ljust(curses.COLS - 1),
+            curses.color_pair(Pairs.STATUS),
+        )
+        self.stdscr.refresh()
+
+    def hide_help(self):
+        self.showing_help = False
+        self.stdscr.erase()
+        self.subtitle_pad.should_render = True
+        if self.playback is not None and self.playback.started_at is not None:
+            self.playback.resume()
+            self.schedule_playback_frame()
+
+    def handle_frames(self):
+        if not self.video.frames.handle_messages():
+            self.loop.remove_reader(self.video.frames)
+            self.set_status("The video decoder stopped unexpectedly")
+
+    def display_frame(self, frame):
+        # Frames are decoded by the frame server. Only the most recently
+        # requested frame is shown, so holding down a key never queues up
+        # more than one decode.
+        self.video.frames.request(frame, self.frame_read)
+
+    def frame_read(self, frame_data, frame):
+        if frame_data is not None and self.playback is None:
+            self.video.show(frame_data, frame)
+
+    def start_playback(self, start_frame, end_frame):
+        playback = self.video.play(start_frame, end_frame, self.playback_speed)
+        self.playback = playback
+        self.status = "Loading audio..."
+        # Get the first subtitles ready while the audio loads
+        self.video.prefetch_subtitles(
+            self.subtitle_pad.get_text_at(start_frame), self.loop.run_in_background
+        )
+        self.prefetched_frame = None
+
+        def ready(error):
+            self.loop.call_soon_threadsafe(self.audio_ready, playback, error)
+
+        playback.open_audio(ready)
+
+    def audio_ready(self, playback, error):
+        if playback is not self.playback:
+            # Playback was stopped before the audio was ready
+            return
+
+        if error is not None:
+            self.stop_playback()
+            self.set_status("Could not play audio")
+            return
+
+        self.status = None
+        playback.start()
+        if self.showing_help:
+            playback.pause()
+        else:
+            self.play_frame()
+
+    def schedule_playback_frame(self):
+        self.playback_timer = self.loop.call_at(
+            self.playback.next_frame_time(), self.play_frame
+        )
+
+    def play_frame(self):
+        self.playback_timer = None
+        frame_num = self.playback.read()
+        if frame_num is None:
+            if self.playback.finished:
+                self.stop_playback()
+                self.render()
+            else:
+                # The frame server hasn't sent the frame yet. Its messages
+                # are handled in the meantime, so try again shortly.
+                self.playback_timer = self.loop.call_later(
+                    PLAYBACK_RETRY_SECONDS, self.play_frame
+                )
+            return
+
+        self.playback_frame = frame_num
+        self.subtitle_pad.set_playback_frame(frame_num)
+        self.render_playback_frame()
+        self.prefetch_subtitles(frame_num)
+
+        # The current frame has just been read and displayed
+        # to the user. Stop if that's the end frame.
+        if frame_num >= self.playback.end_frame:
+            self.stop_playback()
+            self.render()
+        else:
+            self.schedule_playback_frame()
+
+    def prefetch_subtitles(self, frame):
+        # Rasterizing subtitles takes long enough to drop a frame or two, so
+        # the next ones to show are rasterized in the background beforehand
+        if self.prefetched_frame is not None and frame < self.prefetched_frame:
+            return
+        change = self.subtitle_pad.next_text_at(frame)
+        if change is None:
+            self.prefetched_frame = math.inf
+            return
+        self.prefetched_frame, text = change
+        self.video.prefetch_subtitles(text, self.loop.run_in_background)
+
+    def stop_playback(self):
+        if self.playback is None:
+            return
+
+        self.loop.cancel(self.playback_timer)
+        self.playback_timer = None
+        self.playback.stop()
+        self.playback = None
+        self.playback_frame = None
+        self.rendered_timestamp = None
+        self.status = None
+
+        self.subtitle_pad.set_playback_frame(None)
+
+        self.stdscr.addstr(
+            1,
+            0,
+            " " * (curses.COLS - 1),
+        )
@@ -0,0 +1,113 @@
+import heapq
+import itertools
+import os
+import queue
+import selectors
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class EventLoop:
+    # A minimal selector-based event loop. Everything that touches curses or
+    # the video window runs on the thread calling `run`; slow work is pushed
+    # to background threads with `run_in_background` and its result handed
+    # back to the loop through a self-pipe.
+    def __init__(self, max_workers=2):
+        self.selector = selectors.DefaultSelector()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.timers = []
+        self.counter = itertools.count()
+        self.pending = queue.SimpleQueue()
+        self.running = False
+        self.closed = False
+
+        self.wakeup_read, self.wakeup_write = os.pipe()
+        os.set_blocking(self.wakeup_read, False)
+        os.set_blocking(self.wakeup_write, False)
+        self.selector.register(self.wakeup_read, selectors.EVENT_READ, self._wakeup)
+
+    def add_reader(self, fileobj, callback):
+        self.selector.register(fileobj, selectors.EVENT_READ, callback)
+
+    def remove_reader(self, fileobj):
+        self.selector.unregister(fileobj)
+
+    def call_at(self, when, callback, *args):
+        # Timers are mutable lists so that they can be cancelled in place
+        timer = [when, next(self.counter), callback, args]
+        heapq.heappush(self.timers, timer)
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(time.monotonic() + delay, callback, *args)
+
+    def cancel(self, timer):
+        if timer is not None:
+            timer[2] = None
+
+    def call_soon_threadsafe(self, callback, *args):
+        if self.closed:
+            # e.g. background work finishing after the editor has exited
+            return
+        self.pending.put((callback, args))
+        try:
+            os.write(self.wakeup_write, b"\0")
+        except BlockingIOError:
+            # The pipe is full, so the loop is already going to wake up.
+            pass
+
+    def run_in_background(self, fn, *args, callback=None):
+        future = self.executor.submit(fn, *args)
+        if callback is not None:
+            future.add_done_callback(
+                lambda future: self.call_soon_threadsafe(callback, future)
+            )
+        return future
+
+    def run(self):
+        self.running = True
+        while self.running:
+            self.run_once()
+
+    def stop(self):
+        self.running = False
+
+    def run_once(self):
+        timeout = None
+        if not self.pending.empty():
+            timeout = 0
+        elif self.timers:
+            timeout = max(0, self.timers[0][0] - time.monotonic())
+
+        for key, _ in self.selector.select(timeout):
+            key.data()
+
+        self._run_pending()
+
+        now = time.monotonic()
+        while self.timers and self.timers[0][0] <= now:
+            _, _, callback, args = heapq.heappop(self.timers)
+            if callback is not None:
+                callback(*args)
+
+    def close(self):
+        self.closed = True
+        self.executor.shutdown(wait=False)
+        self.selector.close()
+        os.close(self.wakeup_read)
+        os.close(self.wakeup_write)
+
+    def _wakeup(self):
+        try:
+            while os.read(self.wakeup_read, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _run_pending(self):
+        while True:
+            try:
+                callback, args = self.pending.get_nowait()
+            except queue.Empty:
+                return
+            callback(*args)
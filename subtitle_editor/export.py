@@ -0,0 +1,212 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import click
+import ffmpeg
+import srt
+
+from .constants import EXPORT_CRF, EXPORT_PRESET, EXPORT_SEGMENT_SECONDS
+from .subtitles.srt_format import compose
+
+
+def probe(path):
+    # Returns (duration, fps, has_audio, keyframes)
+    info = ffmpeg.probe(path)
+    duration = float(info["format"]["duration"])
+    # Packet times are offset by the start time of the file (non-zero for e.g.
+    # MPEG-TS), whereas -ss and the subtitles count from the start of it
+    start_time = info["format"].get("start_time", "N/A")
+    start_time = float(start_time) if start_time != "N/A" else 0
+    streams = info["streams"]
+    video = next(s for s in streams if s["codec_type"] == "video")
+    numerator, _, denominator = video.get("avg_frame_rate", "0/0").partition("/")
+    fps = float(numerator) / float(denominator) if float(denominator or 0) else 30
+    has_audio = any(s["codec_type"] == "audio" for s in streams)
+
+    # Keyframe times come from the packet flags, so nothing is decoded
+    packets = ffmpeg.probe(
+        path,
+        select_streams="v:0",
+        show_packets=None,
+        show_entries="packet=pts_time,flags",
+    ).get("packets", ())
+    keyframes = sorted(
+        float(packet["pts_time"]) - start_time
+        for packet in packets
+        if "K" in packet.get("flags", "") and packet.get("pts_time", "N/A") != "N/A"
+    )
+    return duration, fps, has_audio, keyframes
+
+
+def plan_segments(duration, keyframes, segment_seconds):
+    # Split [0, duration) into segments of roughly `segment_seconds` that all
+    # start on a keyframe, so each one can be encoded independently.
+    boundaries = [0.0]
+    for keyframe in keyframes:
+        if keyframe - boundaries[-1] >= segment_seconds and keyframe < duration:
+            boundaries.append(keyframe)
+    boundaries.append(duration)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def write_segment_subtitles(subtitles, start, end, path):
+    # Subtitles for a single segment, shifted so that the segment starts at 0
+    offset = timedelta(seconds=start)
+    segment_end = timedelta(seconds=end)
+    shifted = [
+        srt.Subtitle(
+            subtitle.index,
+            max(subtitle.start - offset, timedelta(0)),
+            subtitle.end - offset,
+            subtitle.content,
+            subtitle.proprietary,
+        )
+        for subtitle in subtitles
+        if subtitle.end > offset and subtitle.start < segment_end
+    ]
+    with open(path, "w") as fp:
+        fp.write(compose(shifted))
+
+
+class Progress:
+    # Seconds of video encoded so far by each segment, updated from the
+    # worker threads and reported from the main thread.
+    def __init__(self, duration, fps):
+        self.duration = duration
+        self.fps = fps
+        self.encoded = {}
+        self.lock = threading.Lock()
+        self.started_at = time.monotonic()
+
+    def update(self, segment, seconds):
+        with self.lock:
+            self.encoded[segment] = seconds
+
+    def report(self, end="\r"):
+        with self.lock:
+            encoded = sum(self.encoded.values())
+        elapsed = max(time.monotonic() - self.started_at, 1e-3)
+        click.echo(
+            f"Encoded {encoded / self.duration:4.0%}  "
+            f"{encoded * self.fps / elapsed:6.1f} fps  "
+            f"{encoded / elapsed:5.2f}x realtime",
+            nl=False,
+        )
+        click.echo(end, nl=False)
+
+
+def encode_segment(video, index, start, end, subtitles_path, output, options):
+    stream = ffmpeg.input(video, ss=start, t=end - start)
+    stream = stream.video.filter("subtitles", subtitles_path)
+    stream = ffmpeg.output(
+        stream,
+        output,
+        vcodec="libx264",
+        crf=options["crf"],
+        preset=options["preset"],
+        threads=options["threads"],
+        an=None,
+    )
+    stream = stream.global_args("-progress", "pipe:1", "-nostats")
+    stream = stream.global_args("-loglevel", "error")
+    stream = ffmpeg.overwrite_output(stream)
+    process = ffmpeg.run_async(stream, pipe_stdout=True, pipe_stderr=True)
+
+    # ffmpeg reports progress as key=value lines on stdout
+    for line in process.stdout:
+        key, _, value = line.decode().strip().partition("=")
+        if key == "out_time_us" and value.isdigit():
+            options["progress"].update(index, int(value) / 1000000)
+
+    stderr = process.stderr.read()
+    if process.wait() != 0:
+        raise ffmpeg.Error("ffmpeg", None, stderr)
+    options["progress"].update(index, end - start)
+
+
+def concatenate(video, segment_paths, has_audio, output, work_dir):
+    # Join the segments without re-encoding, taking the audio from the
+    # original video so there are no gaps at the joins.
+    list_path = os.path.join(work_dir, "segments.txt")
+    with open(list_path, "w") as fp:
+        for path in segment_paths:
+            fp.write(f"file '{path}'\n")
+
+    segments = ffmpeg.input(list_path, format="concat", safe=0)
+    streams = [segments.video]
+    if has_audio:
+        streams.append(ffmpeg.input(video).audio)
+    stream = ffmpeg.output(*streams, output, c="copy")
+    stream = stream.global_args("-loglevel", "error")
+    stream = ffmpeg.overwrite_output(stream)
+    ffmpeg.run(stream, quiet=True)
+
+
+def export(
+    video,
+    subtitles,
+    output,
+    jobs,
+    segment_seconds=EXPORT_SEGMENT_SECONDS,
+    crf=EXPORT_CRF,
+    preset=EXPORT_PRESET,
+):
+    duration, fps, has_audio, keyframes = probe(video)
+    segments = plan_segments(duration, keyframes, segment_seconds)
+    progress = Progress(duration, fps)
+    options = {
+        "crf": crf,
+        "preset": preset,
+        # Split the cores between the encoders running at the same time
+        "threads": max(1, (os.cpu_count() or 1) // jobs),
+        "progress": progress,
+    }
+    click.echo(f"Encoding {len(segments)} segments with {jobs} jobs")
+
+    work_dir = tempfile.mkdtemp(prefix="subtitle-editor-export-")
+    try:
+        segment_paths = []
+        # Each worker thread only supervises an ffmpeg process, so threads are
+        # enough to keep every core busy.
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = []
+            for index, (start, end) in enumerate(segments):
+                subtitles_path = os.path.join(work_dir, f"{index:05d}.srt")
+                write_segment_subtitles(subtitles, start, end, subtitles_path)
+                segment_path = os.path.join(work_dir, f"{index:05d}.mkv")
+                segment_paths.append(segment_path)
+                futures.append(
+                    executor.submit(
+                        encode_segment,
+                        video,
+                        index,
+                        start,
+                        end,
+                        subtitles_path,
+                        segment_path,
+                        options,
+                    )
+                )
+
+            while not all(future.done() for future in futures):
+                progress.report()
+                time.sleep(0.5)
+            for future in futures:
+                # Raise the first error, if any
+                future.result()
+        progress.report(end="\n")
+
+        concatenate(video, segment_paths, has_audio, output, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    elapsed = time.monotonic() - progress.started_at
+    click.echo(
+        f"Exported {output} in {elapsed:.1f}s "
+        f"({duration / elapsed:.2f}x realtime, {duration * fps / elapsed:.1f} fps)"
+    )
@@ -0,0 +1,287 @@
+import itertools
+import math
+import multiprocessing
+import signal
+from collections import deque
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from .constants import FRAME_SERVER_MAX_GRAB, FRAME_SERVER_SLOTS
+
+
+def serve(path, connection, slots):
+    # Entry point of the frame server process. Ctrl+C is sent to the whole
+    # process group, but it's up to the client to shut the server down.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    FrameDecoder(path, connection, slots).run()
+
+
+class FrameDecoder:
+    # Runs in the frame server process. Frames are decoded straight into the
+    # slots of a shared memory ring and handed to the client by slot number.
+    # The client gives each slot back once it's done with the frame, which
+    # also limits how far ahead of playback the decoder can get.
+    def __init__(self, path, connection, slots):
+        self.connection = connection
+        self.cap = cv2.VideoCapture(path)
+
+        # Size the slots from a real frame, since the reported width and
+        # height aren't always what the decoder produces
+        ok, frame_data = self.cap.read()
+        shape = frame_data.shape if ok else (1, 1, 3)
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+        self.memory = shared_memory.SharedMemory(
+            create=True, size=slots * int(np.prod(shape))
+        )
+        self.ring = np.ndarray((slots,) + shape, dtype=np.uint8, buffer=self.memory.buf)
+        self.free = deque(range(slots))
+
+        # Latest (request, frame) to read, and the stream being played. The
+        # stream advances `stream_step` frames at a time, which may be
+        # fractional.
+        self.read_request = None
+        self.stream = None
+        self.stream_position = None
+        self.stream_step = 1
+
+        self.connection.send(
+            (
+                "info",
+                self.memory.name,
+                shape,
+                int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+                self.cap.get(cv2.CAP_PROP_FPS) or 30,
+            )
+        )
+
+    def run(self):
+        try:
+            while True:
+                busy = self.free and (
+                    self.read_request is not None or self.stream is not None
+                )
+                # Keep decoding while there's work to do, but only after
+                # handling every message that has arrived in the meantime
+                if not busy:
+                    self.connection.poll(None)
+                while self.connection.poll():
+                    if not self.handle(self.connection.recv()):
+                        return
+
+                if not self.free:
+                    continue
+                if self.read_request is not None:
+                    # Reads for navigation take priority over playback
+                    request, frame = self.read_request
+                    self.read_request = None
+                    slot, position = self.decode(frame - 1)
+                    self.connection.send(("frame", request, slot, position))
+                elif self.stream is not None:
+                    slot, position = self.decode(math.floor(self.stream_position))
+                    if slot is None:
+                        self.connection.send(("end", self.stream))
+                        self.stream = None
+                    else:
+                        self.stream_position += self.stream_step
+                        self.connection.send(("frame", self.stream, slot, position))
+        except (EOFError, OSError):
+            # The client has gone away
+            pass
+        finally:
+            self.ring = None
+            self.memory.close()
+
+    def handle(self, message):
+        kind = message[0]
+        if kind == "read":
+            # Only the most recent read matters, so a burst of requests while
+            # the decoder is busy results in a single decode
+            self.read_request = message[1:]
+        elif kind == "play":
+            _, self.stream, frame, self.stream_step = message
+            self.stream_position = frame - 1
+        elif kind == "stop":
+            self.stream = None
+        elif kind == "release":
+            self.free.append(message[1])
+        elif kind == "close":
+            return False
+        return True
+
+    def decode(self, position):
+        # Decode the frame after `position` into a free slot. Returns the slot
+        # (or None if there are no frames left) and the new position.
+        skip = position - self.cap.get(cv2.CAP_PROP_POS_FRAMES)
+        if 0 < skip <= FRAME_SERVER_MAX_GRAB:
+            # Skipping a few frames, e.g. for faster playback. Grabbing them
+            # without retrieving is cheaper than seeking, which has to decode
+            # forward from the previous keyframe.
+            for _ in range(int(skip)):
+                if not self.cap.grab():
+                    return None, position
+        elif skip != 0:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, position)
+
+        slot = self.free[0]
+        ok, frame_data = self.cap.read(self.ring[slot])
+        if not ok or frame_data.shape != self.ring[slot].shape:
+            return None, position
+        if not np.shares_memory(frame_data, self.ring[slot]):
+            self.ring[slot] = frame_data
+        self.free.popleft()
+        return slot, self.cap.get(cv2.CAP_PROP_POS_FRAMES)
+
+
+class FrameServer:
+    # Client side of the frame server. Decoding happens in a separate process
+    # so that it never competes with the UI for the GIL; decoded frames are
+    # read in place from shared memory rather than copied across.
+    #
+    # `handle_messages` must be called whenever the connection is readable
+    # (the object can be registered with an event loop directly).
+    def __init__(self, path, slots=FRAME_SERVER_SLOTS):
+        # Spawn rather than fork, so the server doesn't inherit the state of
+        # curses, PyAudio or any running threads
+        context = multiprocessing.get_context("spawn")
+        self.connection, server_connection = context.Pipe()
+        self.process = context.Process(
+            target=serve, args=(path, server_connection, slots), daemon=True
+        )
+        self.process.start()
+        server_connection.close()
+        self.connected = True
+
+        self.memory = None
+        self.ring = None
+        self.frame_count = None
+        self.fps = None
+
+        self.requests = itertools.count()
+        # (request, callback) of the latest read
+        self.read_request = None
+        self.stream = None
+        self.stream_frames = deque()
+        self.stream_ended = False
+
+    def fileno(self):
+        return self.connection.fileno()
+
+    def wait_until_ready(self):
+        # Block until the server has opened the video
+        while self.ring is None and self.connected:
+            self.receive()
+
+    def handle_messages(self):
+        # Returns False if the server has gone away
+        while self.connected and self.connection.poll():
+            self.receive()
+        return self.connected
+
+    def receive(self):
+        try:
+            message = self.connection.recv()
+        except (EOFError, OSError):
+            self.connected = False
+            return
+
+        kind = message[0]
+        if kind == "info":
+            _, name, shape, self.frame_count, self.fps = message
+            self.memory = shared_memory.SharedMemory(name=name)
+            self.ring = np.ndarray(
+                (len(self.memory.buf) // int(np.prod(shape)),) + shape,
+                dtype=np.uint8,
+                buffer=self.memory.buf,
+            )
+        elif kind == "frame":
+            _, request, slot, position = message
+            if self.read_request is not None and request == self.read_request[0]:
+                _, callback = self.read_request
+                self.read_request = None
+                try:
+                    callback(None if slot is None else self.ring[slot], position)
+                finally:
+                    if slot is not None:
+                        self.release(slot)
+            elif request == self.stream and slot is not None:
+                self.stream_frames.append((slot, position))
+            elif slot is not None:
+                # Superseded by a newer request
+                self.release(slot)
+        elif kind == "end":
+            if message[1] == self.stream:
+                self.stream_ended = True
+
+    def send(self, *message):
+        if self.connected:
+            try:
+                self.connection.send(message)
+            except OSError:
+                self.connected = False
+
+    def request(self, frame, callback):
+        # Decode `frame` in the background. `callback` is called from
+        # `handle_messages` with the frame data, which is only valid until the
+        # callback returns (or None if the frame could not be read), and the
+        # frame number. Any earlier request that hasn't completed yet is
+        # dropped.
+        request = next(self.requests)
+        self.read_request = (request, callback)
+        self.send("read", request, frame)
+
+    def start_stream(self, frame, step=1):
+        # Start decoding frames from `frame` onwards, advancing `step` frames
+        # at a time
+        self.stop_stream()
+        self.stream = next(self.requests)
+        self.stream_ended = False
+        self.send("play", self.stream, frame, step)
+
+    def next_stream_frame(self):
+        # Returns (slot, frame) for the next frame of the stream, or None if it
+        # hasn't been received yet. Frames are queued by `handle_messages`, so
+        # this never waits for the server. The caller must `release` the slot
+        # once it's done with it.
+        if not self.stream_frames:
+            return None
+        return self.stream_frames.popleft()
+
+    @property
+    def stream_finished(self):
+        # True once every frame of the stream has been handed out
+        return not self.stream_frames and (self.stream_ended or not self.connected)
+
+    def stop_stream(self):
+        if self.stream is None:
+            return
+        self.stream = None
+        self.send("stop")
+        while self.stream_frames:
+            self.release(self.stream_frames.popleft()[0])
+
+    def view(self, slot):
+        return self.ring[slot]
+
+    def release(self, slot):
+        self.send("release", slot)
+
+    def close(self):
+        self.send("close")
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.connection.close()
+        self.connected = False
+
+        if self.memory is not None:
+            # Views of the buffer have to go before it can be closed
+            self.ring = None
+            self.memory.close()
+            try:
+                self.memory.unlink()
+            except FileNotFoundError:
+                pass
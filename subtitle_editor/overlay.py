@@ -0,0 +1,148 @@
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from .constants import OVERLAY_CACHE_SIZE
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+# Font scale and line spacing at a frame height of 1080 pixels
+FONT_SCALE = 1.6
+LINE_SPACING = 1.5
+# Space left below the text, as a fraction of the frame height
+BOTTOM_MARGIN = 0.06
+
+
+class Overlay:
+    # Text rasterized for one frame size, as indices into the bytes of the
+    # flattened frame. Pixels that are fully covered by the text are simply
+    # overwritten; only those along its anti-aliased edges need blending.
+    def __init__(self, frame_shape, top, left, alpha, color):
+        rows, columns = np.nonzero(alpha)
+        pixels = (rows + top) * frame_shape[1] + columns + left
+        # Every channel of each pixel
+        indices = (pixels[:, None] * frame_shape[2] + np.arange(frame_shape[2])).ravel()
+        alpha = np.repeat(alpha[rows, columns], frame_shape[2])
+        color = np.repeat(color[rows, columns], frame_shape[2])
+
+        opaque = alpha == 256
+        self.opaque_indices = indices[opaque]
+        self.opaque_values = (color[opaque] >> 8).astype(np.uint8)
+        # `color` is premultiplied by alpha, which is scaled to 0-256 so
+        # that blending can divide by shifting
+        self.blend_indices = indices[~opaque]
+        self.blend_inverse_alpha = 256 - alpha[~opaque]
+        self.blend_color = color[~opaque]
+
+    def draw(self, frame_data):
+        pixels = frame_data.reshape(-1)
+        blended = pixels[self.blend_indices] * self.blend_inverse_alpha
+        blended += self.blend_color
+        blended >>= 8
+        pixels[self.blend_indices] = blended
+        pixels[self.opaque_indices] = self.opaque_values
+
+
+class SubtitleRenderer:
+    # Draws subtitles onto video frames, roughly the way a player would show
+    # them (using OpenCV's built-in fonts, which may not cover every
+    # character).
+    # Rasterizing text is slow, so each subtitle is rasterized once per frame
+    # size into an alpha mask, and kept in a least-recently-used cache.
+    # Drawing a frame then only touches the pixels under the text.
+    # Subtitles can also be rasterized ahead of time with `prefetch`.
+    def __init__(self, cache_size=OVERLAY_CACHE_SIZE):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        # Keys being rasterized in the background
+        self.pending = set()
+
+    def draw(self, frame_data, text):
+        # Draw `text` onto `frame_data`, in place if possible. Returns the
+        # frame to show.
+        if not text or not text.strip() or frame_data.ndim != 3:
+            return frame_data
+
+        key = (text, frame_data.shape)
+        overlay = self.cache.get(key)
+        if overlay is None and key not in self.cache:
+            overlay = self.rasterize(text, frame_data.shape)
+            self.add(key, overlay)
+        else:
+            self.cache.move_to_end(key)
+        if overlay is None:
+            return frame_data
+
+        frame_data = np.ascontiguousarray(frame_data)
+        overlay.draw(frame_data)
+        return frame_data
+
+    def prefetch(self, text, frame_shape, run_in_background):
+        # Rasterize `text` for frames of `frame_shape` on a background thread,
+        # before it needs drawing. `run_in_background` is
+        # EventLoop.run_in_background, whose callback runs on the thread that
+        # draws, so the cache is only ever touched from there.
+        key = (text, frame_shape)
+        if (
+            not text
+            or not text.strip()
+            or len(frame_shape) != 3
+            or key in self.cache
+            or key in self.pending
+        ):
+            return
+
+        def done(future):
+            self.pending.discard(key)
+            if future.exception() is None and key not in self.cache:
+                self.add(key, future.result())
+
+        self.pending.add(key)
+        run_in_background(self.rasterize, text, frame_shape, callback=done)
+
+    def add(self, key, overlay):
+        self.cache[key] = overlay
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def rasterize(self, text, frame_shape):
+        # Returns an Overlay for white text with a black outline, centred at
+        # the bottom of the frame, or None if the frame is too small.
+        height, width = frame_shape[:2]
+        scale = FONT_SCALE * height / 1080
+        thickness = max(1, round(2 * scale))
+        outline = max(2, round(2 * scale))
+
+        lines = [line for line in text.splitlines() if line.strip()]
+        sizes = [cv2.getTextSize(line, FONT, scale, thickness) for line in lines]
+        ascent = max(h for (_, h), _ in sizes)
+        descent = max(baseline for _, baseline in sizes) + thickness
+        line_height = round((ascent + descent) * LINE_SPACING)
+        text_width = min(max(w for (w, _), _ in sizes) + 2 * outline, width)
+        text_height = min(
+            line_height * (len(lines) - 1) + ascent + descent + 2 * outline, height
+        )
+
+        fill_mask = np.zeros((text_height, text_width), dtype=np.uint8)
+        for number, (line, ((line_width, _), _)) in enumerate(zip(lines, sizes)):
+            origin = (
+                (text_width - line_width) // 2,
+                outline + ascent + line_height * number,
+            )
+            cv2.putText(
+                fill_mask, line, origin, FONT, scale, 255, thickness, cv2.LINE_AA
+            )
+        # Grow the text to get its outline
+        kernel = cv2.getStructuringElement(
+            cv2.MORPH_ELLIPSE, (2 * outline + 1, 2 * outline + 1)
+        )
+        outline_mask = cv2.dilate(fill_mask, kernel)
+
+        alpha = np.maximum(outline_mask, fill_mask).astype(np.uint16)
+        alpha += alpha >> 7
+        fill = fill_mask.astype(np.uint16)
+        fill += fill >> 7
+
+        top = max(0, height - text_height - round(height * BOTTOM_MARGIN))
+        left = (width - text_width) // 2
+        return Overlay(frame_shape, top, left, alpha, fill * 255)
@@ -0,0 +1,56 @@
+import collections
+import contextlib
+
+from ..constants import UNDO_LIMIT
+
+
+class History:
+    # Undo/redo stacks of timestamp edits. Each entry is a tuple of
+    # (index, start_delta, end_delta) changes in frames, so memory use only
+    # depends on the number of entries kept, not on the number of subtitles.
+    def __init__(self, limit=UNDO_LIMIT):
+        self.undo_stack = collections.deque(maxlen=limit)
+        self.redo_stack = collections.deque(maxlen=limit)
+        self.group = None
+
+    def record(self, index, start_delta, end_delta):
+        if not start_delta and not end_delta:
+            return
+
+        change = (index, start_delta, end_delta)
+        if self.group is not None:
+            self.group.append(change)
+            return
+        self.undo_stack.append((change,))
+        self.redo_stack.clear()
+
+    @contextlib.contextmanager
+    def grouped(self):
+        # Record every change made inside the block as a single entry. Nested
+        # groups are folded into the outermost one.
+        if self.group is not None:
+            yield
+            return
+
+        self.group = []
+        try:
+            yield
+        finally:
+            group, self.group = self.group, None
+            if group:
+                self.undo_stack.append(tuple(group))
+                self.redo_stack.clear()
+
+    def undo(self):
+        if not self.undo_stack:
+            return None
+        changes = self.undo_stack.pop()
+        self.redo_stack.append(changes)
+        return changes
+
+    def redo(self):
+        if not self.redo_stack:
+            return None
+        changes = self.redo_stack.pop()
+        self.undo_stack.append(changes)
+        return changes
@@ -0,0 +1,180 @@
+import bisect
+import curses
+
+import numpy as np
+
+from ..colors import Pairs
+from ..constants import UNSET_FRAME
+
+# Glyphs for how much of a column is covered by subtitles, in eighths
+BLOCKS = np.array(list(" ▁▂▃▄▅▆▇█"))
+# Drawn at the start of a subtitle that has no end time
+OPEN_END = "?"
+# Rounding errors left behind by incremental updates
+EPSILON = 1e-6
+
+
+class Minimap:
+    # One-line overview of the whole video, showing how much of each column's
+    # share of it is covered by subtitles. Coverage is accumulated for every
+    # subtitle at once when the file is loaded, then adjusted for just the
+    # subtitle that changed, so drawing only ever depends on the width.
+    # `frames` (arrays of start and end frames) can be given if they're
+    # already known.
+    def __init__(self, subtitles, validator, frame_count, width, frames=None):
+        self.subtitles = subtitles
+        self.validator = validator
+
+        # Subtitles that aren't shown at all are counted at the end of the
+        # line, e.g. " ?12", so leave room for the largest possible count.
+        self.suffix_width = len(str(len(subtitles))) + 2
+        self.width = max(1, width - self.suffix_width)
+
+        if frames is None:
+            frames = (
+                np.array([s.get_start() for s in subtitles]),
+                np.array([s.get_end() for s in subtitles]),
+            )
+        last_frame = np.max(frames[1], initial=0)
+        self.frames_per_column = max(frame_count, last_frame, 1) / self.width
+
+        # Fraction of each column covered by subtitles. More than 1 means
+        # that subtitles overlap there.
+        self.coverage = np.zeros(self.width)
+        # Number of subtitles starting in each column without an end time
+        self.open_ends = np.zeros(self.width, dtype=int)
+        # Number of subtitles without a start time
+        self.untimed = 0
+        self.timed = np.zeros(len(subtitles), dtype=bool)
+
+        # What each subtitle currently adds, so that it can be taken away again
+        # when the subtitle is retimed: its span in (fractional) columns, and
+        # the column of its open end (or -1).
+        self.starts = np.zeros(len(subtitles))
+        self.ends = np.zeros(len(subtitles))
+        self.open_columns = np.full(len(subtitles), -1)
+
+        self.build(*frames)
+
+    def build(self, starts, ends):
+        starts = np.asarray(starts, dtype=float)
+        ends = np.asarray(ends, dtype=float)
+        timed = starts != UNSET_FRAME
+        closed = timed & (ends != UNSET_FRAME)
+        open_ended = timed & (ends == UNSET_FRAME)
+
+        starts /= self.frames_per_column
+        ends /= self.frames_per_column
+        # Anything that isn't a closed interval covers nothing
+        self.starts = np.where(closed, starts, 0)
+        self.ends = np.where(closed, ends, 0)
+        self.accumulate(self.starts, self.ends, 1)
+
+        self.open_columns = np.where(open_ended, self.column_of(starts), -1)
+        np.add.at(self.open_ends, self.open_columns[open_ended], 1)
+        self.timed = timed
+        self.untimed = int(np.count_nonzero(~timed))
+
+    def accumulate(self, starts, ends, sign):
+        # Add (or with a sign of -1, remove) the coverage of the spans from
+        # `starts` to `ends`, in columns. The columns that a span covers
+        # completely are added with a difference array, and the partly
+        # covered columns at either end separately.
+        starts = np.clip(starts, 0, self.width)
+        ends = np.clip(ends, starts, self.width)
+        first = self.column_of(starts)
+        last = self.column_of(ends)
+        spans = last > first
+
+        np.add.at(self.coverage, first, sign * (np.minimum(ends, first + 1) - starts))
+        np.add.at(self.coverage, last[spans], sign * (ends[spans] - last[spans]))
+
+        difference = np.zeros(self.width)
+        np.add.at(difference, first[spans] + 1, sign)
+        np.add.at(difference, last[spans], -sign)
+        self.coverage += np.cumsum(difference)
+
+    def column_of(self, columns):
+        return np.minimum(np.floor(columns).astype(int), self.width - 1)
+
+    def column(self, frame):
+        # Column showing `frame`, or None if it's unset
+        if frame == UNSET_FRAME:
+            return None
+        return min(max(int(frame / self.frames_per_column), 0), self.width - 1)
+
+    def update(self, index):
+        # Replace what the subtitle at `index` adds with its current timing
+        span = slice(index, index + 1)
+        self.accumulate(self.starts[span], self.ends[span], -1)
+        if self.open_columns[index] >= 0:
+            self.open_ends[self.open_columns[index]] -= 1
+
+        if not self.timed[index]:
+            self.untimed -= 1
+
+        subtitle = self.subtitles[index]
+        start = subtitle.get_start()
+        end = subtitle.get_end()
+        self.timed[index] = start != UNSET_FRAME
+        self.starts[index] = 0
+        self.ends[index] = 0
+        self.open_columns[index] = -1
+        if start == UNSET_FRAME:
+            self.untimed += 1
+        elif end == UNSET_FRAME:
+            self.open_columns[index] = self.column(start)
+            self.open_ends[self.open_columns[index]] += 1
+        else:
+            self.starts[index] = start / self.frames_per_column
+            self.ends[index] = end / self.frames_per_column
+            self.accumulate(self.starts[span], self.ends[span], 1)
+
+    def subtitle_at(self, column):
+        # Index of the subtitle under `column`: the last one to start before
+        # the end of the column if it's still showing, otherwise whichever
+        # starts closest to the column. None if no subtitles have a start time.
+        timeline = self.validator.timeline
+        if not timeline:
+            return None
+        column_start = column * self.frames_per_column
+        column_end = column_start + self.frames_per_column
+
+        position = bisect.bisect_left(timeline, (column_end,))
+        if position > 0:
+            index = timeline[position - 1][1]
+            end = self.subtitles[index].get_end()
+            if end == UNSET_FRAME or end > column_start:
+                return index
+
+        middle = column_start + self.frames_per_column / 2
+        candidates = timeline[max(position - 1, 0) : position + 1]
+        return min(candidates, key=lambda key: abs(key[0] - middle))[1]
+
+    def render(self, window, line, marker=None):
+        # Draw the minimap on `line` of `window`, highlighting the column
+        # `marker` (if any)
+        levels = np.clip(np.ceil(self.coverage * 8 - EPSILON), 0, 8).astype(int)
+        glyphs = BLOCKS[levels]
+        glyphs[self.open_ends > 0] = OPEN_END
+        window.addstr(line, 0, "".join(glyphs), curses.color_pair(Pairs.MINIMAP))
+
+        # Overlapping subtitles and open ends
+        problems = (self.coverage > 1 + EPSILON) | (self.open_ends > 0)
+        for column in np.flatnonzero(problems):
+            window.addstr(
+                line,
+                int(column),
+                glyphs[column],
+                curses.color_pair(Pairs.MINIMAP_WARNING),
+            )
+        if marker is not None:
+            window.addstr(line, marker, glyphs[marker], curses.color_pair(Pairs.STATUS))
+
+        suffix = f" ?{self.untimed}" if self.untimed else ""
+        window.addstr(
+            line,
+            self.width,
+            suffix.ljust(self.suffix_width),
+            curses.color_pair(Pairs.WARNING) if self.untimed else curses.A_NORMAL,
+        )
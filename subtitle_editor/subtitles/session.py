@@ -0,0 +1,351 @@
+import collections.abc
+import hashlib
+import os
+import tempfile
+from datetime import timedelta
+
+import numpy as np
+import srt
+
+from ..constants import SESSION_VERSION
+from .srt import SubtitleEntry
+from .validator import PROBLEMS, Validator
+
+MAGIC = b"SESN"
+HEADER = np.dtype(
+    [
+        ("magic", "S4"),
+        ("version", "<u4"),
+        # Hash of the subtitle file the snapshot was saved with
+        ("hash", "u1", 16),
+        ("fps", "<f8"),
+        # Width that the content was wrapped to
+        ("width", "<u4"),
+        ("count", "<u4"),
+        # Editor state: the selected subtitle and timestamp, and how many
+        # lines the selected subtitle was from the top of the window
+        ("index", "<u4"),
+        ("timestamp", "u1"),
+        ("scroll", "<i4"),
+    ]
+)
+RECORD = np.dtype(
+    [
+        ("start_ms", "<i8"),
+        ("end_ms", "<i8"),
+        ("start_frame", "<i4"),
+        ("end_frame", "<i4"),
+        # Byte offsets of the content in the subtitle file
+        ("content_start", "<u8"),
+        ("content_end", "<u8"),
+        ("wrapped_lines", "<u2"),
+        # Problems found by the validator, see encode_problems
+        ("problems", "<u2"),
+    ]
+)
+TIMESTAMPS = ("start", "end")
+
+
+def session_path(path):
+    # The snapshot sits next to the subtitle file, e.g. .video.srt.session
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, f".{name}.session")
+
+
+def file_hash(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def encode_problems(problems):
+    # Up to four problems, in order, as three bits each
+    return sum((PROBLEMS.index(p) + 1) << 3 * i for i, p in enumerate(problems))
+
+
+def decode_problems(code):
+    problems = []
+    while code:
+        problems.append(PROBLEMS[(code & 7) - 1])
+        code >>= 3
+    return tuple(problems)
+
+
+class SessionSubtitle(srt.Subtitle):
+    # A subtitle loaded from a session snapshot. Its timestamps and content
+    # are only converted from the snapshot and the subtitle file once
+    # something needs them, since most subtitles are never shown or edited.
+    def __init__(self, index, start_ms, end_ms, data, content_start, content_end):
+        self.index = index
+        self.proprietary = ""
+        self._start = None
+        self._end = None
+        self._content = None
+        self._milliseconds = (start_ms, end_ms)
+        self._data = data
+        self._content_span = (content_start, content_end)
+
+    @property
+    def start(self):
+        if self._start is None:
+            self._start = timedelta(milliseconds=self._milliseconds[0])
+        return self._start
+
+    @start.setter
+    def start(self, start):
+        self._start = start
+
+    @property
+    def end(self):
+        if self._end is None:
+            self._end = timedelta(milliseconds=self._milliseconds[1])
+        return self._end
+
+    @end.setter
+    def end(self, end):
+        self._end = end
+
+    @property
+    def content(self):
+        if self._content is None:
+            start, end = self._content_span
+            self._content = self._data[start:end].decode("utf-8", errors="replace")
+            self._data = None
+        return self._content
+
+    @content.setter
+    def content(self, content):
+        self._content = content
+
+
+class LazyList(collections.abc.Sequence):
+    # A list whose items are made by `make(index)` the first time they're
+    # used, and kept from then on so each one stays the same object.
+    def __init__(self, length, make):
+        self.items = [None] * length
+        self.make = make
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        item = self.items[index]
+        if item is None:
+            item = self.items[index] = self.make(index)
+        return item
+
+    def __iter__(self):
+        for index in range(len(self.items)):
+            yield self[index]
+
+
+class Session:
+    # A session snapshot: everything the editor works out when it loads a
+    # subtitle file, stored in a compact binary file that is memory-mapped
+    # rather than read, so reopening a large file doesn't have to parse it,
+    # wrap every subtitle or check them all for problems again. The
+    # subtitle file stays the source of truth: the snapshot is only used if
+    # it was saved with exactly the same file.
+    def __init__(self, data, header, records):
+        self.data = data
+        self.records = records
+        self.fps = float(header["fps"])
+        self.width = int(header["width"])
+        self.index = int(header["index"])
+        self.selected_timestamp = TIMESTAMPS[int(header["timestamp"]) % 2]
+        self.scroll = int(header["scroll"])
+
+    def subtitles(self):
+        # Only the subtitles that are used are created, which for a large file
+        # is usually just the ones that get shown
+        starts = self.records["start_ms"].tolist()
+        ends = self.records["end_ms"].tolist()
+        content_starts = self.records["content_start"].tolist()
+        content_ends = self.records["content_end"].tolist()
+        return LazyList(
+            len(starts),
+            lambda i: SessionSubtitle(
+                i + 1, starts[i], ends[i], self.data, content_starts[i], content_ends[i]
+            ),
+        )
+
+    def frames(self, fps):
+        # (start frames, end frames) as arrays
+        if fps == self.fps:
+            return self.records["start_frame"], self.records["end_frame"]
+        # Opened with a different video
+        starts, ends = self.records["start_ms"], self.records["end_ms"]
+        return frames(starts, fps), frames(ends, fps)
+
+    def entries(self, subtitles, wrapper, fps):
+        start_frames, end_frames = self.frames(fps)
+        start_frames, end_frames = start_frames.tolist(), end_frames.tolist()
+        if wrapper.width == self.width:
+            wrapped_lines = self.records["wrapped_lines"].tolist()
+        else:
+            wrapped_lines = [None] * len(subtitles)
+
+        return LazyList(
+            len(subtitles),
+            lambda i: SubtitleEntry(
+                subtitles[i],
+                wrapper,
+                fps,
+                (start_frames[i], end_frames[i]),
+                wrapped_lines[i],
+            ),
+        )
+
+    def line_offsets(self, width):
+        # SubtitlePad's line offsets, or None if the content needs wrapping
+        # again to a different width
+        if width != self.width:
+            return None
+        lines = self.records["wrapped_lines"].astype(np.int64) + 3
+        return [0] + np.cumsum(lines).tolist()
+
+    def timeline(self, fps):
+        # The Validator's timeline: (start frame, index), sorted
+        starts = self.frames(fps)[0]
+        order = np.argsort(starts, kind="stable")
+        return list(zip(starts[order].tolist(), order.tolist()))
+
+    def problems(self, fps):
+        # {index: problems} for the Validator, or None if they need checking
+        # again because the frame rate has changed
+        if fps != self.fps:
+            return None
+        codes = self.records["problems"]
+        indices = np.flatnonzero(codes)
+        codes = codes[indices].tolist()
+        # Only a few combinations of problems come up, so decode each once
+        decoded = {code: decode_problems(code) for code in set(codes)}
+        return {index: decoded[code] for index, code in zip(indices.tolist(), codes)}
+
+
+def frames(milliseconds, fps):
+    # The same as SubtitleEntry's conversion from a timedelta
+    return np.floor(milliseconds / 1000 * fps).astype(np.int32)
+
+
+def wrapped_lines(entry, data, start, end):
+    # Number of lines the content will wrap to when the file is opened again,
+    # which is usually what it wraps to now, unless `compose` had to change
+    # the content to make it valid
+    if end - start == len(entry.subtitle.content.encode()):
+        return entry.nlines() - 2
+    return len(entry.wrapper.wrap(data[start:end].decode("utf-8", errors="replace")))
+
+
+def load_session(path):
+    # Returns the Session saved with the subtitle file at `path`, or None if
+    # there isn't one or the file has changed since
+    try:
+        with open(path, "rb") as fp:
+            data = fp.read()
+        snapshot = np.memmap(session_path(path), dtype=np.uint8, mode="r")
+    except (OSError, ValueError):
+        # ValueError for an empty snapshot, which can't be mapped
+        return None
+
+    if len(snapshot) < HEADER.itemsize:
+        return None
+    header = snapshot[: HEADER.itemsize].view(HEADER)[0]
+    if (
+        header["magic"] != MAGIC
+        or header["version"] != SESSION_VERSION
+        or len(snapshot) != HEADER.itemsize + int(header["count"]) * RECORD.itemsize
+        or header["hash"].tobytes() != file_hash(data)
+    ):
+        return None
+    return Session(data, header, snapshot[HEADER.itemsize :].view(RECORD))
+
+
+def save_session(path, data, written, subtitle_pad):
+    # Save a snapshot for the subtitle file at `path`, which has just been
+    # written with `data`. `written` is the list filled in by `compose`.
+    snapshot_path = session_path(path)
+    if not written or any(subtitle.proprietary for subtitle, _, _ in written):
+        # Proprietary metadata isn't kept in snapshots
+        remove_session(path)
+        return
+
+    # The subtitles are in the order they were written in, which is the
+    # order they'll be in when the file is opened again
+    entries = {id(entry.subtitle): entry for entry in subtitle_pad.subtitles}
+    entries = [entries[id(subtitle)] for subtitle, _, _ in written]
+    fps = subtitle_pad.fps
+
+    records = np.zeros(len(written), dtype=RECORD)
+    milliseconds = timedelta(milliseconds=1)
+    records["start_ms"] = [subtitle.start // milliseconds for subtitle, _, _ in written]
+    records["end_ms"] = [subtitle.end // milliseconds for subtitle, _, _ in written]
+    # Timestamps are only written to the millisecond, so work the frames out
+    # from what was written rather than taking them from the editor
+    records["start_frame"] = frames(records["start_ms"], fps)
+    records["end_frame"] = frames(records["end_ms"], fps)
+    records["content_start"] = [start for _, start, _ in written]
+    records["content_end"] = [end for _, _, end in written]
+    records["wrapped_lines"] = [
+        wrapped_lines(entry, data, start, end)
+        for entry, (_, start, end) in zip(entries, written)
+    ]
+
+    # Problems depend on the order of the subtitles, which may have changed,
+    # and on the frames as written
+    validator = Validator(
+        [
+            SubtitleEntry(subtitle, subtitle_pad.wrapper, fps, frames)
+            for (subtitle, _, _), frames in zip(
+                written,
+                zip(records["start_frame"].tolist(), records["end_frame"].tolist()),
+            )
+        ],
+        fps,
+    )
+    for index, problems in validator.problems.items():
+        records["problems"][index] = encode_problems(problems)
+
+    selected = subtitle_pad.get_selected_subtitle()
+    header = np.zeros(1, dtype=HEADER)
+    header["magic"] = MAGIC
+    header["version"] = SESSION_VERSION
+    header["hash"] = np.frombuffer(file_hash(data), dtype=np.uint8)
+    header["fps"] = fps
+    header["width"] = subtitle_pad.wrapper.width
+    header["count"] = len(written)
+    header["index"] = next(
+        (i for i, entry in enumerate(entries) if entry is selected), 0
+    )
+    header["timestamp"] = TIMESTAMPS.index(subtitle_pad.selected_timestamp)
+    header["scroll"] = (
+        subtitle_pad.line_offsets()[subtitle_pad.index] - subtitle_pad.start_line
+    )
+
+    # Write to a temporary file and move it into place, so the snapshot is
+    # never partly written and any mapping of the old one stays valid
+    # The snapshot only makes opening the file faster, so failing to write it
+    # isn't an error
+    try:
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(snapshot_path), suffix=".tmp"
+        )
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(header.tobytes())
+            fp.write(records.tobytes())
+        os.replace(tmp_path, snapshot_path)
+    except OSError:
+        pass
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def remove_session(path):
+    try:
+        os.remove(session_path(path))
+    except OSError:
+        pass
@@ -1,4 +1,6 @@
+import bisect
 import curses
+import itertools
 import math
 from datetime import timedelta
 from textwrap import TextWrapper
@@ -6,16 +8,26 @@ from textwrap import TextWrapper
 import srt
 
 from ..colors import Pairs
-from ..constants import UNSET_TIME, UNSET_FRAME
+from ..constants import UNDO_LIMIT, UNSET_TIME, UNSET_FRAME
+from .history import History
+from .minimap import Minimap
+from .validator import Validator
 
 
 class SubtitleEntry:
-    def __init__(self, subtitle, wrapper, fps):
+    # `frames` and `wrapped_lines` can be given when they're already known
+    # (from a session snapshot), to save working them out again.
+    def __init__(self, subtitle, wrapper, fps, frames=None, wrapped_lines=None):
         self.subtitle = subtitle
         self.wrapper = wrapper
-        self.wrapped_content = wrapper.wrap(subtitle.content)
         self.fps = fps
+        # Content is only wrapped once the subtitle is drawn
+        self._wrapped_content = None
+        self.wrapped_lines = wrapped_lines
 
+        if frames is not None:
+            self.start_frame, self.end_frame = frames
+            return
         if subtitle.start == UNSET_TIME:
             self.start_frame = UNSET_FRAME
         else:
@@ -25,14 +37,24 @@ class SubtitleEntry:
         else:
             self.end_frame = math.floor(subtitle.end.total_seconds() * fps)
 
+    @property
+    def wrapped_content(self):
+        if self._wrapped_content is None:
+            self._wrapped_content = self.wrapper.wrap(self.subtitle.content)
+        return self._wrapped_content
+
     def nlines(self):
         # Length of an SRT is:
         # - 1 for the number
         # - 1 for the timestamp
         # - 1 for each line of content
-        return 2 + len(self.wrapped_content)
+        if self.wrapped_lines is None:
+            self.wrapped_lines = len(self.wrapped_content)
+        return 2 + self.wrapped_lines
 
-    def render(self, pad, is_selected, selected_timestamp, start_line, dim=False):
+    def render(
+        self, pad, is_selected, selected_timestamp, start_line, dim=False, problems=()
+    ):
         default_style = curses.A_NORMAL
         standout_style = curses.A_STANDOUT
         if dim:
@@ -47,6 +69,15 @@ class SubtitleEntry:
             else:
                 end_style = standout_style
         pad.addstr(start_line, 0, str(self.subtitle.index), default_style)
+        if problems:
+            # Flag problems found by the validator next to the subtitle number
+            offset = len(str(self.subtitle.index)) + 1
+            pad.addstr(
+                start_line,
+                offset,
+                f"! {', '.join(problems)}"[: self.wrapper.width - offset - 1],
+                curses.color_pair(Pairs.WARNING),
+            )
 
         start_timestamp = srt.timedelta_to_srt_timestamp(
             max(self.subtitle.start, timedelta(0))
@@ -77,6 +108,17 @@ class SubtitleEntry:
         self.start_frame = min(self.start_frame, self.end_frame - 1)
         self.subtitle.start = timedelta(seconds=self.start_frame / self.fps)
 
+    def restore(self, start_frame, end_frame):
+        # Set both frames as-is, without the clamping done by set_start and
+        # set_end, so that undoing an edit can also restore unset times.
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        for attr, frame in (("start", start_frame), ("end", end_frame)):
+            if frame == UNSET_FRAME:
+                setattr(self.subtitle, attr, UNSET_TIME)
+            else:
+                setattr(self.subtitle, attr, timedelta(seconds=frame / self.fps))
+
     def get_start(self):
         return self.start_frame
 
@@ -85,9 +127,22 @@ class SubtitleEntry:
 
 
 class SubtitlePad:
-    def __init__(self, subtitles, window_start_line, window_end_line, ncols, fps):
+    def __init__(
+        self,
+        subtitles,
+        window_start_line,
+        window_end_line,
+        ncols,
+        fps,
+        frame_count=0,
+        undo_limit=UNDO_LIMIT,
+        session=None,
+    ):
         self.wrapper = TextWrapper(width=ncols)
-        self.subtitles = [SubtitleEntry(s, self.wrapper, fps) for s in subtitles]
+        if session is not None:
+            self.subtitles = session.entries(subtitles, self.wrapper, fps)
+        else:
+            self.subtitles = [SubtitleEntry(s, self.wrapper, fps) for s in subtitles]
         self.index = 0
         self.selected_timestamp = "start"
 
@@ -99,61 +154,75 @@ class SubtitlePad:
         self.ncols = ncols
 
         self.fps = fps
+        if session is not None:
+            self.validator = Validator(
+                self.subtitles,
+                fps,
+                timeline=session.timeline(fps),
+                problems=session.problems(fps),
+                ends=session.frames(fps)[1],
+            )
+        else:
+            self.validator = Validator(self.subtitles, fps)
+        # Drawn by the editor, on a line of its own across the whole window
+        self.minimap = Minimap(
+            self.subtitles,
+            self.validator,
+            frame_count,
+            ncols - 1,
+            frames=session.frames(fps) if session is not None else None,
+        )
+        self.history = History(undo_limit)
 
         self.should_render = True
 
         self.pad = None
         self.playback_frame = None
+        # (selected index, in-bounds) as of the last playback frame, which is
+        # all that the pad's contents depend on during playback
+        self.playback_key = None
+
+        # Line on which each subtitle starts, plus the line after the last one.
+        # Only timestamps can be edited, so these never change.
+        self.offsets = None
+        if session is not None:
+            self.offsets = session.line_offsets(self.wrapper.width)
+
+        if session is not None and self.subtitles:
+            self.index = min(session.index, len(self.subtitles) - 1)
+            self.selected_timestamp = session.selected_timestamp
+            self.start_line = max(0, self.line_offsets()[self.index] - session.scroll)
+            self.end_line = self.start_line + self.displayed_lines
+
+    def line_offsets(self):
+        if self.offsets is None:
+            self.offsets = [0]
+            self.offsets.extend(
+                itertools.accumulate(s.nlines() + 1 for s in self.subtitles)
+            )
+        return self.offsets
 
     def init_pad(self):
         # Separate function to initialize the curses pad, to simplify testing.
-        self.pad = curses.newpad(self.nlines(), self.ncols)
+        # Only the subtitles on screen are drawn, so the pad needs room for a
+        # page plus the subtitles cut off at the top and bottom of it.
+        offsets = self.line_offsets()
+        tallest = max((b - a for a, b in zip(offsets, offsets[1:])), default=0)
+        self.pad = curses.newpad(self.displayed_lines + 2 * tallest + 1, self.ncols)
 
     def nlines(self):
         # The total number of lines is:
         # - number of lines for each subtitle
         # - one line of buffer between subtitles
         # - one full page of empty line after the last subtitle
-        return (
-            sum(s.nlines() for s in self.subtitles)
-            + len(self.subtitles)
-            + self.displayed_lines
-        )
+        return self.line_offsets()[-1] + self.displayed_lines
 
     def render(self):
         if not self.should_render:
             return
 
-        self.pad.erase()
-
-        # Redraw all subtitles
-        start_line = 0
-        for index, subtitle in enumerate(self.subtitles):
-            # Only dim by default if we're in playback mode
-            dim = self.playback_frame is not None
-            if index == self.index and self.playback_frame is not None:
-                start_frame = subtitle.get_start()
-                end_frame = subtitle.get_end()
-
-                # Treat unset as "infinitely" large so that it feels more
-                # natural during playback of lyrics
-                if end_frame == UNSET_FRAME:
-                    end_frame = math.inf
-
-                # Make the selected timestamp dim if it's not in-bounds.
-                dim = not (start_frame <= self.playback_frame <= end_frame)
-            subtitle.render(
-                self.pad,
-                index == self.index,
-                self.selected_timestamp,
-                start_line,
-                dim=dim,
-            )
-            start_line += subtitle.nlines() + 1
-
-        selected_start = (
-            sum(s.nlines() for s in self.subtitles[: self.index]) + self.index
-        )
+        offsets = self.line_offsets()
+        selected_start = offsets[self.index]
         selected_end = selected_start + self.subtitles[self.index].nlines()
         if self.playback_frame is not None:
             # In playback mode, always display the selected subtitle at the top
@@ -168,8 +237,33 @@ class SubtitlePad:
             elif selected_end > self.end_line:
                 self.end_line = selected_end
                 self.start_line = selected_end - self.displayed_lines
+
+        self.pad.erase()
+
+        # Draw the subtitles on screen, starting with the one at the top of the
+        # window (which may be partly scrolled off)
+        first = bisect.bisect_right(offsets, self.start_line) - 1
+        top = offsets[first]
+        for index in range(first, len(self.subtitles)):
+            if offsets[index] >= self.end_line:
+                break
+            subtitle = self.subtitles[index]
+            # Only dim by default if we're in playback mode
+            dim = self.playback_frame is not None
+            if index == self.index and self.playback_frame is not None:
+                # Make the selected timestamp dim if it's not in-bounds.
+                dim = not self.in_bounds(subtitle, self.playback_frame)
+            subtitle.render(
+                self.pad,
+                index == self.index,
+                self.selected_timestamp,
+                offsets[index] - top,
+                dim=dim,
+                problems=self.validator.get_problems(index),
+            )
+
         self.pad.noutrefresh(
-            self.start_line,
+            self.start_line - top,
             0,
             self.window_start_line,
             0,
@@ -202,6 +296,8 @@ class SubtitlePad:
 
     def set_frame(self, frame, progress=False):
         subtitle = self.get_selected_subtitle()
+        old_start = subtitle.get_start()
+        old_end = subtitle.get_end()
         if self.selected_timestamp == "start":
             subtitle.set_start(frame)
             if progress:
@@ -209,6 +305,50 @@ class SubtitlePad:
         else:
             subtitle.set_end(frame)
 
+        self.history.record(
+            self.index,
+            subtitle.get_start() - old_start,
+            subtitle.get_end() - old_end,
+        )
+        self.validator.update(self.index)
+        self.minimap.update(self.index)
+        self.should_render = True
+
+    def undo(self):
+        changes = self.history.undo()
+        if changes:
+            # Revert the changes in the opposite order to how they were made
+            self.apply_changes(reversed(changes), -1)
+
+    def redo(self):
+        changes = self.history.redo()
+        if changes:
+            self.apply_changes(changes, 1)
+
+    def apply_changes(self, changes, direction):
+        for index, start_delta, end_delta in changes:
+            subtitle = self.subtitles[index]
+            subtitle.restore(
+                subtitle.get_start() + direction * start_delta,
+                subtitle.get_end() + direction * end_delta,
+            )
+            self.validator.update(index)
+            self.minimap.update(index)
+
+        # Select the timestamp that was changed last
+        self.index = index
+        self.selected_timestamp = "start" if start_delta else "end"
+        self.should_render = True
+
+    def next_problem(self):
+        index = self.validator.next_problem(self.index)
+        if index is None or index == self.index:
+            return
+        self.select(index)
+
+    def select(self, index):
+        self.index = index
+        self.selected_timestamp = "start"
         self.should_render = True
 
     def get_frame(self):
@@ -217,6 +357,58 @@ class SubtitlePad:
             return subtitle.get_start()
         return subtitle.get_end()
 
+    def in_bounds(self, subtitle, frame):
+        # Treat unset as "infinitely" large so that it feels more natural
+        # during playback of lyrics
+        end_frame = subtitle.get_end()
+        if end_frame == UNSET_FRAME:
+            end_frame = math.inf
+        return subtitle.get_start() <= frame <= end_frame
+
+    def showing_at(self, frame):
+        # Indices of the subtitles showing at `frame`, the way a player would
+        # show them. A subtitle without an end time only shows until the next
+        # one starts.
+        timeline = self.validator.timeline
+        end = bisect.bisect_right(timeline, (frame, math.inf))
+        showing = []
+        for position in range(end - 1, -1, -1):
+            index = timeline[position][1]
+            subtitle = self.subtitles[index]
+            if subtitle.get_end() == UNSET_FRAME:
+                if position == end - 1:
+                    showing.append(index)
+            elif frame < subtitle.get_end():
+                showing.append(index)
+            # Stop once everything earlier on the timeline has ended
+            latest_end = self.validator.latest_end_before(index)
+            if latest_end is None or latest_end <= frame:
+                break
+        return sorted(showing)
+
+    def get_text_at(self, frame):
+        # Content of the subtitles showing at `frame`
+        return "\n".join(
+            self.subtitles[i].subtitle.content for i in self.showing_at(frame)
+        )
+
+    def next_text_at(self, frame):
+        # (frame, text) for the next time after `frame` that the subtitles
+        # showing change, or None if they don't
+        timeline = self.validator.timeline
+        position = bisect.bisect_right(timeline, (frame, math.inf))
+        changes = [
+            self.subtitles[i].get_end()
+            for i in self.showing_at(frame)
+            if self.subtitles[i].get_end() != UNSET_FRAME
+        ]
+        if position < len(timeline):
+            changes.append(timeline[position][0])
+        if not changes:
+            return None
+        change = min(changes)
+        return change, self.get_text_at(change)
+
     def set_playback_frame(self, frame):
         self.playback_frame = frame
 
@@ -224,28 +416,28 @@ class SubtitlePad:
 
         # Setting playback_frame to None means playback mode is ended
         if frame is None:
+            self.playback_key = None
             self.should_render = True
             return
 
         for index, subtitle in enumerate(self.subtitles):
-            start_frame = subtitle.get_start()
-            # treat unset end as infinite so that it feels more natural during
-            # playback of lyrics
-            end_frame = subtitle.get_end()
-            if end_frame == UNSET_FRAME:
-                end_frame = math.inf
-
             # Select the first index that contains the frame
-            if start_frame <= frame <= end_frame:
+            if self.in_bounds(subtitle, frame):
                 new_index = index
                 break
 
             # Or select the first subtitle that starts after the frame
-            if start_frame > frame:
+            if subtitle.get_start() > frame:
                 new_index = index
                 break
 
-        self.should_render = True
         if new_index != self.index:
             self.selected_timestamp = "start"
             self.index = new_index
+
+        # Most frames change nothing on the pad, so only redraw it when the
+        # selected subtitle or whether the frame is inside it changes
+        key = (self.index, self.in_bounds(self.subtitles[self.index], frame))
+        if key != self.playback_key:
+            self.playback_key = key
+            self.should_render = True
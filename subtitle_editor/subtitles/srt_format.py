@@ -0,0 +1,201 @@
+import mmap
+import re
+from datetime import timedelta
+
+import srt
+
+TIMESTAMP_SEPARATOR = "-->"
+# Fallback for timestamps that aren't in the canonical 00:00:00,000 form,
+# e.g. single-digit hours, "." as the millisecond separator or fewer digits.
+TIMESTAMP_REGEX = re.compile(r"^(\d+):(\d+):(\d+)(?:[,.](\d{1,3}))?$")
+# Lines containing only whitespace also separate blocks
+BLANK_LINE_REGEX = re.compile(r"^[ \t]+$", re.MULTILINE)
+PARSE_CHUNK_SIZE = 1024 * 1024
+
+
+class SRTFormatError(ValueError):
+    pass
+
+
+def parse_timestamp(text):
+    # Fast path for the canonical 00:00:00,000 form
+    if len(text) == 12 and text[2] == text[5] == ":" and text[8] in ",.":
+        try:
+            return timedelta(
+                0,
+                int(text[0:2]) * 3600 + int(text[3:5]) * 60 + int(text[6:8]),
+                0,
+                int(text[9:12]),
+            )
+        except ValueError:
+            pass
+
+    match = TIMESTAMP_REGEX.match(text)
+    if match is None:
+        raise SRTFormatError(f"invalid timestamp {text!r}")
+    hours, minutes, seconds, millis = match.groups()
+    return timedelta(
+        0,
+        int(hours) * 3600 + int(minutes) * 60 + int(seconds),
+        0,
+        int((millis or "0").ljust(3, "0")),
+    )
+
+
+def parse_block(block):
+    # Parse the text of a single SRT block (without the surrounding blank
+    # lines). Raises SRTFormatError if it isn't a valid subtitle.
+    lines = block.split("\n")
+    if TIMESTAMP_SEPARATOR in lines[0]:
+        # The number is optional, as it is for srt.parse
+        index = None
+        lines.insert(0, None)
+    else:
+        index = lines[0].strip()
+        # isdigit() alone also accepts e.g. superscripts, which int() doesn't
+        if not (index.isascii() and index.isdigit()):
+            raise SRTFormatError(f"expected a subtitle number, got {lines[0]!r}")
+        index = int(index)
+    if len(lines) < 2:
+        raise SRTFormatError("missing timestamps")
+
+    timestamps = lines[1]
+    if timestamps[12:17] == " --> " and timestamps[29:30] in ("", " "):
+        start = timestamps[:12]
+        end = timestamps[17:29]
+        proprietary = timestamps[29:]
+    else:
+        start, separator, rest = timestamps.partition(TIMESTAMP_SEPARATOR)
+        if not separator:
+            raise SRTFormatError(f"expected timestamps, got {timestamps!r}")
+        end, _, proprietary = rest.strip().partition(" ")
+        start = start.strip()
+
+    return srt.Subtitle(
+        index,
+        parse_timestamp(start),
+        parse_timestamp(end),
+        "\n".join(lines[2:]),
+        proprietary.strip(),
+    )
+
+
+def find_blank_line(data, start, end, reverse=False):
+    # Return the position just after a blank line in data[start:end], or -1
+    find = data.rfind if reverse else data.find
+    for separator in (b"\n\n", b"\n\r\n"):
+        position = find(separator, start, end)
+        if position != -1:
+            return position + len(separator)
+    return -1
+
+
+def read_chunks(data):
+    # Split a bytes-like object (e.g. an mmap) into decoded chunks that end on
+    # a blank line, so that no SRT block is split across two chunks.
+    position = 0
+    if data[:3] == b"\xef\xbb\xbf":
+        # Drop the byte order mark some editors add to UTF-8 files
+        position = 3
+
+    size = len(data)
+    while position < size:
+        end = min(position + PARSE_CHUNK_SIZE, size)
+        if end < size:
+            boundary = find_blank_line(data, position, end, reverse=True)
+            if boundary == -1:
+                boundary = find_blank_line(data, end, size)
+            end = size if boundary == -1 else boundary
+
+        chunk = data[position:end].decode("utf-8", errors="replace")
+        if "\r" in chunk:
+            chunk = chunk.replace("\r\n", "\n")
+        if BLANK_LINE_REGEX.search(chunk):
+            chunk = BLANK_LINE_REGEX.sub("", chunk)
+        yield chunk
+        position = end
+
+
+def parse(chunks, errors):
+    # Parse an iterable of text chunks in a single pass, yielding
+    # srt.Subtitle objects. Chunks must end on a block boundary. Malformed
+    # blocks are skipped and recorded in `errors` as (line_number, message)
+    # tuples instead of aborting the whole file.
+    line_number = 1
+    for chunk in chunks:
+        for block in chunk.split("\n\n"):
+            stripped = block.lstrip("\n")
+            line_number += len(block) - len(stripped)
+            block = stripped.rstrip("\n")
+            if block:
+                try:
+                    yield parse_block(block)
+                except SRTFormatError as e:
+                    errors.append((line_number, str(e)))
+            line_number += stripped.count("\n") + 2
+        # The final split of every chunk isn't followed by a separator
+        line_number -= 2
+
+
+def parse_file(path):
+    # Returns (subtitles, errors). The file is memory-mapped rather than read
+    # into memory up front, and parsed in a single streaming pass.
+    errors = []
+    with open(path, "rb") as fp:
+        try:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped
+            return [], errors
+        with data:
+            subtitles = list(parse(read_chunks(data), errors))
+    return subtitles, errors
+
+
+def format_timestamp(timestamp):
+    hours, seconds = divmod(timestamp.seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return "%02d:%02d:%02d,%03d" % (
+        hours + timestamp.days * 24,
+        minutes,
+        seconds,
+        timestamp.microseconds // 1000,
+    )
+
+
+def compose(subtitles, written=None):
+    # Equivalent to srt.compose with its default arguments: subtitles are
+    # sorted, empty or invalid ones are skipped and the rest are reindexed.
+    # Builds the output with a single join instead of copying every subtitle.
+    # If `written` is a list, (subtitle, start, end) is appended to it for each
+    # subtitle in the output, with the offsets of its content in the output
+    # encoded as UTF-8.
+    zero = timedelta(0)
+    output = []
+    index = 0
+    position = 0
+    for subtitle in sorted(subtitles, key=lambda s: (s.start, s.end, s.index or 0)):
+        start = subtitle.start
+        end = subtitle.end
+        content = subtitle.content
+        if start < zero or start >= end or not content.strip():
+            continue
+
+        if not content or content[0] == "\n" or "\n\n" in content:
+            content = srt.make_legal_content(content)
+        index += 1
+        if subtitle.proprietary:
+            timestamps = (
+                f"{format_timestamp(start)} --> {format_timestamp(end)} "
+                f"{subtitle.proprietary}"
+            )
+        else:
+            timestamps = f"{format_timestamp(start)} --> {format_timestamp(end)}"
+        header = f"{index}\n{timestamps}\n"
+        output.append(f"{header}{content}\n\n")
+        if written is not None:
+            content_start = position + len(header.encode())
+            position = content_start + len(content.encode())
+            written.append((subtitle, content_start, position))
+            position += 2
+    return "".join(output)
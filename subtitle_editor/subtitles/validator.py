@@ -0,0 +1,267 @@
+import bisect
+import math
+
+import numpy as np
+
+from ..constants import MIN_DURATION, MIN_GAP_FRAMES, UNSET_FRAME
+
+OVERLAP = "overlap"
+OUT_OF_ORDER = "order"
+TOO_SHORT = "short"
+TOO_CLOSE = "gap"
+# In the order they're reported in
+PROBLEMS = (TOO_SHORT, OUT_OF_ORDER, OVERLAP, TOO_CLOSE)
+
+
+class Validator:
+    # The timeline and `problems` ({index: tuple of problem names}) can be
+    # given when they're already known, e.g. from a session snapshot, to skip
+    # checking every subtitle. So can `ends`, an array of every subtitle's end
+    # frame, to sweep the timeline without going through each subtitle.
+    def __init__(
+        self,
+        subtitles,
+        fps,
+        min_duration=MIN_DURATION,
+        min_gap=MIN_GAP_FRAMES,
+        timeline=None,
+        problems=None,
+        ends=None,
+    ):
+        self.subtitles = subtitles
+        self.min_duration = math.ceil(min_duration.total_seconds() * fps)
+        self.min_gap = min_gap
+
+        # (start_frame, index) for every subtitle with a start time, kept sorted.
+        # Overlaps and gaps are found by sweeping along it, keeping track of
+        # the latest end so far.
+        self.timeline = []
+        self.timeline_keys = {}
+
+        # index -> (latest end frame of the subtitles before it on the
+        # timeline, index of the subtitle that ends then), or (None, None).
+        # Worked out when first needed if the problems were given, from `ends`
+        # if those were given too.
+        self.reach = None
+        self.ends = None
+        # index -> (index it's compared against, problem) for the subtitles
+        # that overlap or come too soon after an earlier one, and the same the
+        # other way round: index -> {later index: problem}.
+        self.relations = {}
+        self.owned = {}
+
+        # index -> tuple of problem names, plus a sorted list of the indices
+        # that have problems so we can jump between them.
+        self.problems = {}
+        self.problem_indices = []
+
+        self.validate(timeline, problems, ends)
+
+    def validate(self, timeline=None, problems=None, ends=None):
+        if timeline is not None:
+            self.timeline = timeline
+        else:
+            self.timeline = sorted(
+                (subtitle.get_start(), index)
+                for index, subtitle in enumerate(self.subtitles)
+                if subtitle.get_start() != UNSET_FRAME
+            )
+        self.timeline_keys = {key[1]: key for key in self.timeline}
+        self.reach = None
+        self.ends = None
+        self.relations = {}
+        self.owned = {}
+        if problems is not None:
+            self.problems = dict(problems)
+            self.problem_indices = sorted(self.problems)
+            # The sweep is left until it's needed
+            self.ends = ends
+            return
+
+        self._sweep_all()
+        self.problems = {}
+        self.problem_indices = []
+        for index in range(len(self.subtitles)):
+            self._check(index)
+
+    def update(self, index):
+        # The subtitle that changed and its neighbours in list order can be
+        # affected, plus every subtitle on the timeline from where it was or is
+        # now up to where the latest end so far is the same as before.
+        if self.reach is None:
+            self._sweep_all()
+        affected = {index - 1, index, index + 1}
+        positions = []
+
+        old_key = self.timeline_keys.pop(index, None)
+        if old_key is not None:
+            position = bisect.bisect_left(self.timeline, old_key)
+            del self.timeline[position]
+            del self.reach[index]
+            affected.update(self._set_relation(index, None, None))
+            positions.append(position)
+
+        start = self.subtitles[index].get_start()
+        if start != UNSET_FRAME:
+            key = (start, index)
+            bisect.insort(self.timeline, key)
+            self.timeline_keys[index] = key
+            positions.append(bisect.bisect_left(self.timeline, key))
+
+        if positions:
+            affected.update(self._sweep(min(positions), max(positions)))
+
+        for i in affected:
+            if 0 <= i < len(self.subtitles):
+                self._check(i)
+
+    def get_problems(self, index):
+        return self.problems.get(index, ())
+
+    def latest_end_before(self, index):
+        # Latest end frame of the subtitles before `index` on the timeline, or
+        # None if none of them has an end time
+        if self.reach is None:
+            self._sweep_all()
+        return self.reach[index][0]
+
+    def next_problem(self, index):
+        # Index of the first problem after `index`, wrapping around to the
+        # start of the file. None if there are no problems at all.
+        if not self.problem_indices:
+            return None
+        position = bisect.bisect_right(self.problem_indices, index)
+        if position == len(self.problem_indices):
+            position = 0
+        return self.problem_indices[position]
+
+    def _sweep_all(self):
+        self.reach = {}
+        self.relations = {}
+        self.owned = {}
+        if self.ends is not None:
+            # Only the first sweep can use them, since subtitles change after
+            # that. An update sweeps again from the subtitle that changed.
+            self._sweep_ends(self.ends)
+            self.ends = None
+        else:
+            self._sweep(0, len(self.timeline) - 1)
+
+    def _sweep_ends(self, ends):
+        # The same as _sweep, over the whole timeline, worked out with numpy
+        # from the end frames rather than one subtitle at a time
+        count = len(self.timeline)
+        starts = np.fromiter((start for start, _ in self.timeline), np.int64, count)
+        order = np.fromiter((index for _, index in self.timeline), np.int64, count)
+        ends = np.asarray(ends, dtype=np.int64)[order]
+        reached = np.where(ends == UNSET_FRAME, -1, ends)
+        # Latest end before each position, and the position it's from (the
+        # first to reach it), or -1 if nothing before has ended
+        latest = np.concatenate(([-1], np.maximum.accumulate(reached)[:-1]))
+        owners = np.where(reached > latest, np.arange(count), -1)
+        owners = np.concatenate(([-1], np.maximum.accumulate(owners)[:-1]))
+        has_owner = owners >= 0
+        owners = np.where(has_owner, order[owners], -1)
+
+        self.reach = dict(zip(order.tolist(), zip(latest.tolist(), owners.tolist())))
+        for index in order[~has_owner].tolist():
+            self.reach[index] = (None, None)
+
+        gaps = starts - latest
+        for problem, found in (
+            (OVERLAP, has_owner & (gaps < 0)),
+            (TOO_CLOSE, has_owner & (gaps >= 0) & (gaps < self.min_gap)),
+        ):
+            for index, owner in zip(order[found].tolist(), owners[found].tolist()):
+                self.relations[index] = (owner, problem)
+                self.owned.setdefault(owner, {})[index] = problem
+
+    def _sweep(self, position, last):
+        # Compare the subtitles on the timeline from `position` on with the
+        # latest end before each of them. Once past `last`, stop as soon as
+        # that's the same as it was, since nothing after can have changed.
+        # Returns the indices whose overlaps or gaps changed.
+        affected = set()
+        if position > 0:
+            previous = self.timeline[position - 1][1]
+            latest = self._extend(self.reach[previous], previous)
+        else:
+            latest = (None, None)
+
+        for start, index in self.timeline[position:]:
+            if position > last and self.reach.get(index) == latest:
+                break
+            self.reach[index] = latest
+
+            end, owner = latest
+            problem = None
+            if owner is not None:
+                gap = start - end
+                if gap < 0:
+                    problem = OVERLAP
+                elif gap < self.min_gap:
+                    problem = TOO_CLOSE
+            affected.update(self._set_relation(index, owner, problem))
+
+            latest = self._extend(latest, index)
+            position += 1
+        return affected
+
+    def _extend(self, latest, index):
+        # The latest end so far, after the subtitle at `index`
+        end = self.subtitles[index].get_end()
+        if end != UNSET_FRAME and (latest[1] is None or end > latest[0]):
+            return (end, index)
+        return latest
+
+    def _set_relation(self, index, owner, problem):
+        # Returns the indices whose problems may have changed
+        new = (owner, problem) if problem else None
+        old = self.relations.get(index)
+        if old == new:
+            return ()
+        if old is not None:
+            del self.relations[index]
+            del self.owned[old[0]][index]
+            if not self.owned[old[0]]:
+                del self.owned[old[0]]
+        if new is not None:
+            self.relations[index] = new
+            self.owned.setdefault(owner, {})[index] = problem
+        return {index, owner, old[0] if old else None} - {None}
+
+    def _check(self, index):
+        subtitle = self.subtitles[index]
+        start = subtitle.get_start()
+        end = subtitle.get_end()
+        problems = []
+
+        if (
+            start != UNSET_FRAME
+            and end != UNSET_FRAME
+            and end - start < self.min_duration
+        ):
+            problems.append(TOO_SHORT)
+
+        if start != UNSET_FRAME and index > 0:
+            previous_start = self.subtitles[index - 1].get_start()
+            if previous_start != UNSET_FRAME and start < previous_start:
+                problems.append(OUT_OF_ORDER)
+
+        # Overlaps and gaps are reported on both subtitles involved
+        pair_problems = set(self.owned.get(index, {}).values())
+        if index in self.relations:
+            pair_problems.add(self.relations[index][1])
+        problems.extend(p for p in (OVERLAP, TOO_CLOSE) if p in pair_problems)
+
+        self._set_problems(index, tuple(problems))
+
+    def _set_problems(self, index, problems):
+        had_problems = index in self.problems
+        if problems:
+            self.problems[index] = problems
+            if not had_problems:
+                bisect.insort(self.problem_indices, index)
+        elif had_problems:
+            del self.problems[index]
+            del self.problem_indices[bisect.bisect_left(self.problem_indices, index)]
@@ -1,92 +1,354 @@
-import os
-import tempfile
+import math
+import threading
 import time
-import wave
 
 import cv2
 import ffmpeg
 import pyaudio
 
+from .audio import RingBuffer, TimeStretcher, output_latency
+from .constants import (
+    AUDIO_BUFFER_SECONDS,
+    AUDIO_CHANNELS,
+    AUDIO_CHUNK_SIZE,
+    AUDIO_FRAME_SIZE,
+    AUDIO_RATE,
+    AUDIO_SAMPLE_WIDTH,
+)
+from .frame_server import FrameServer
+from .overlay import SubtitleRenderer
+
 
 class Video:
-    def __init__(self, path):
+    def __init__(self, path, cache=None):
         self.path = path
+        self.cache = cache
+        self.cache_key = cache.key(path) if cache is not None else None
 
-        self.cap = cv2.VideoCapture(path)
-        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30
+        # Frames are decoded by a separate process. It starts in the
+        # background, so with a cached probe the editor doesn't have to wait
+        # for the video to be opened before it's on screen.
+        self.frames = FrameServer(path)
+        probe = self.cache_get_json("probe")
+        if probe is None:
+            self.frames.wait_until_ready()
+            probe = {
+                "frame_count": self.frames.frame_count or 0,
+                "fps": self.frames.fps or 30,
+            }
+            # Only cache what the decoder actually found, rather than the
+            # defaults for a video it couldn't open
+            if probe["frame_count"]:
+                self.cache_put_json("probe", probe)
+        self.frame_count = probe["frame_count"]
+        self.fps = probe["fps"]
 
         self.window_name = "Video"
+        # Returns the text of the subtitles showing at a frame, if set
+        self.subtitles_at = None
+        self.subtitle_renderer = SubtitleRenderer()
+        self.audio_process = None
+        self.closed = False
+
+    def cache_get_json(self, name):
+        if self.cache is None:
+            return None
+        return self.cache.get_json(self.cache_key, name)
+
+    def cache_put_json(self, name, value):
+        if self.cache is not None:
+            self.cache.put_json(self.cache_key, name, value)
+
+    def cached_audio(self):
+        # Path to the decoded audio track in the cache, if there is one
+        if self.cache is None:
+            return None
+        return self.cache.get_path(self.cache_key, "audio")
+
+    def cache_audio(self):
+        # Decode the whole audio track into the cache, so that playback can
+        # read it directly instead of running ffmpeg every time. Slow, so
+        # meant to run on a background thread.
+        if self.cache is None or self.cached_audio() is not None:
+            return
+        if self.cache_get_json("audio-error") is not None:
+            # Decoding it failed before (e.g. there's no audio track), so it
+            # would only fail again
+            return
+        # Don't decode a track that would be evicted again straight away (or
+        # one of unknown length)
+        size = self.frame_count / self.fps * AUDIO_RATE * AUDIO_FRAME_SIZE
+        if not size or not self.cache.fits(size):
+            return
+
+        def write(path):
+            stream = ffmpeg.input(self.path)
+            stream = ffmpeg.output(
+                stream,
+                path,
+                format="s16le",
+                acodec="pcm_s16le",
+                ac=AUDIO_CHANNELS,
+                ar=AUDIO_RATE,
+            )
+            stream = stream.global_args("-loglevel", "error")
+            stream = ffmpeg.overwrite_output(stream)
+            self.audio_process = ffmpeg.run_async(stream, quiet=True)
+            if self.closed:
+                self.audio_process.kill()
+            _, stderr = self.audio_process.communicate()
+            if self.audio_process.returncode != 0:
+                raise ffmpeg.Error("ffmpeg", None, stderr)
+
+        try:
+            self.cache.store(self.cache_key, "audio", write)
+        except ffmpeg.Error as e:
+            if self.closed:
+                # Killed because the editor is closing
+                return
+            error = (e.stderr or b"").decode("utf-8", errors="replace").strip()
+            self.cache_put_json("audio-error", error)
+            raise
+
+    def close(self):
+        # Stop any background audio caching and the frame server
+        self.closed = True
+        if self.audio_process is not None and self.audio_process.poll() is None:
+            self.audio_process.kill()
+        self.frames.close()
+
+    def show(self, frame_data, frame=None):
+        # Must be called from the main thread. Draws the subtitles showing at
+        # `frame` (if given) onto the frame data in place.
+        if frame is not None and self.subtitles_at is not None:
+            frame_data = self.subtitle_renderer.draw(
+                frame_data, self.subtitles_at(frame)
+            )
+        cv2.imshow(self.window_name, frame_data)
+        cv2.waitKey(1)
 
-    def set_current_frame(self, frame):
-        # Set `frame - 1` to force reading of `frame`
-        return self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame - 1)
-
-    def get_current_frame(self):
-        return self.cap.get(cv2.CAP_PROP_POS_FRAMES)
-
-    def display_frame(self, frame):
-        if self.get_current_frame() != frame - 1:
-            self.set_current_frame(frame)
-        ok, frame_data = self.cap.read()
-        if ok:
-            cv2.imshow(self.window_name, frame_data)
-            cv2.waitKey(1)
-
-    def play(self, start_frame, end_frame):
-        start_ts = start_frame / self.fps
-        end_ts = end_frame / self.fps
-        input_kwargs = {
-            "ss": start_ts,
-            "t": end_ts - start_ts,
-        }
-
-        # Set up audio clip
-        temp_dir = tempfile.gettempdir()
-        audio_filename = os.path.join(
-            temp_dir,
-            # Always use the same file because we only play one at a time.
-            "subtitle-editor-audio.wav",
+    def prefetch_subtitles(self, text, run_in_background):
+        # Rasterize `text` in the background, so that drawing it once it shows
+        # doesn't hold up playback
+        if self.frames.ring is not None:
+            self.subtitle_renderer.prefetch(
+                text, self.frames.ring.shape[1:], run_in_background
+            )
+
+    def play(self, start_frame, end_frame, speed=1):
+        return Playback(self, start_frame, end_frame, speed)
+
+
+class Playback:
+    # Playback of the video & audio between two frames. Audio is streamed from
+    # ffmpeg as raw PCM by a reader thread into a ring buffer that PyAudio
+    # pulls from on its own callback thread, so playback can start as soon as
+    # the first chunk arrives. Video frames are decoded ahead by the frame
+    # server in the meantime. The caller calls `start` once audio is ready,
+    # then `read` (at `next_frame_time`) from the main thread.
+    #
+    # At speeds other than 1x the audio is time-stretched, and above 1x frames
+    # are skipped by the frame server rather than shown faster.
+    def __init__(self, video, start_frame, end_frame, speed=1):
+        self.video = video
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.speed = speed
+
+        self.process = None
+        self.audio_buffer = RingBuffer(
+            AUDIO_RATE * AUDIO_FRAME_SIZE * AUDIO_BUFFER_SECONDS
         )
-        stream = ffmpeg.input(self.path, **input_kwargs)
-        stream = ffmpeg.output(stream, audio_filename)
-        stream = ffmpeg.overwrite_output(stream)
-        ffmpeg.run(stream, quiet=True)
-        wave_file = wave.open(audio_filename, "rb")
-        audio_chunk = int(wave_file.getframerate() / self.fps)
-        p = pyaudio.PyAudio()
-
-        audio_stream = p.open(
-            format=p.get_format_from_width(wave_file.getsampwidth()),
-            channels=wave_file.getnchannels(),
-            rate=wave_file.getframerate(),
-            output=True,
+        self.stretcher = TimeStretcher(self.audio_buffer, AUDIO_CHANNELS)
+        self.stretcher.speed = speed
+        self.pyaudio = None
+        self.audio_stream = None
+
+        self.frames_read = 0
+        self.last_frame = None
+        # The frame shown at `started_at`
+        self.anchor_frame = start_frame
+        # Seconds between audio leaving the callback and being heard
+        self.output_latency = 0
+        self.started_at = None
+        self.paused_at = None
+        self.stopped = False
+
+    def open_audio(self, ready):
+        # Start decoding audio. `ready` is called from the reader thread with
+        # None once the first chunk is buffered, or with an error if ffmpeg
+        # exits without producing any audio.
+        start_ts = self.start_frame / self.video.fps
+        end_ts = self.end_frame / self.video.fps
+        self.video.frames.start_stream(self.start_frame, self.step)
+
+        cached_audio = self.video.cached_audio()
+        if cached_audio is not None:
+            # Read the clip straight out of the decoded track in the cache
+            source = open(cached_audio, "rb")
+            source.seek(round(max(start_ts, 0) * AUDIO_RATE) * AUDIO_FRAME_SIZE)
+            remaining = round((end_ts - start_ts) * AUDIO_RATE) * AUDIO_FRAME_SIZE
+        else:
+            stream = ffmpeg.input(self.video.path, ss=start_ts, t=end_ts - start_ts)
+            stream = ffmpeg.output(
+                stream,
+                "pipe:",
+                format="s16le",
+                acodec="pcm_s16le",
+                ac=AUDIO_CHANNELS,
+                ar=AUDIO_RATE,
+            )
+            stream = stream.global_args("-loglevel", "error")
+            self.process = ffmpeg.run_async(stream, pipe_stdout=True, quiet=True)
+            source = self.process.stdout
+            remaining = None
+
+        reader = threading.Thread(
+            target=self._read_audio, args=(source, remaining, ready), daemon=True
         )
+        reader.start()
 
-        self.set_current_frame(start_frame)
-        frame_delta = 1 / self.fps
-        while self.cap.isOpened():
-            ok, frame_data = self.cap.read()
-            if ok:
-                # Maintain framerate
-                t0 = time.process_time()
-                audio_data = wave_file.readframes(audio_chunk)
-                audio_stream.write(audio_data)
-                cv2.imshow(self.window_name, frame_data)
-                cv2.waitKey(1)
-                # The current frame has just been read and displayed
-                # to the user. Exit if that's the end frame.
-                current_frame = self.get_current_frame()
-                yield current_frame
-                if current_frame >= end_frame:
-                    break
-                # Each loop should be no shorter than a frame.
-                t1 = time.process_time()
-                remaining = frame_delta - (t1 - t0)
-                if remaining > 0:
-                    time.sleep(remaining)
-            else:
+    def _read_audio(self, source, remaining, ready):
+        is_ready = False
+        while not self.audio_buffer.closed:
+            size = AUDIO_CHUNK_SIZE
+            if remaining is not None:
+                size = min(size, remaining)
+                remaining -= size
+            data = source.read(size) if size > 0 else b""
+            if not data:
                 break
+            self.audio_buffer.write(data)
+            if not is_ready:
+                ready(None)
+                is_ready = True
+        self.audio_buffer.finish()
+
+        if self.process is None:
+            source.close()
+            if not is_ready:
+                ready(None)
+        elif not is_ready:
+            stderr = self.process.stderr.read()
+            if self.process.wait() != 0:
+                ready(ffmpeg.Error("ffmpeg", None, stderr))
+            else:
+                # Nothing to play, e.g. a zero-length clip
+                ready(None)
+
+    def start(self, audio_interface=pyaudio.PyAudio):
+        # `audio_interface` can be replaced with anything that has the same
+        # interface as PyAudio, e.g. to run without a sound card
+        self.pyaudio = audio_interface()
+        self.audio_stream = self.pyaudio.open(
+            format=self.pyaudio.get_format_from_width(AUDIO_SAMPLE_WIDTH),
+            channels=AUDIO_CHANNELS,
+            rate=AUDIO_RATE,
+            output=True,
+            stream_callback=self._audio_callback,
+        )
+
+        self.started_at = time.monotonic()
+
+    def _audio_callback(self, in_data, frame_count, time_info, status):
+        self.output_latency = output_latency(self.audio_stream, time_info)
+        size = frame_count * AUDIO_FRAME_SIZE
+        data = self.stretcher.read(frame_count)
+        if len(data) < size:
+            if self.stretcher.done:
+                return data, pyaudio.paComplete
+            # ffmpeg has fallen behind; play silence rather than stalling
+            data += bytes(size - len(data))
+        return data, pyaudio.paContinue
+
+    @property
+    def step(self):
+        # Frames to advance for each frame shown. Slower playback shows every
+        # frame for longer instead.
+        return max(1, self.speed)
+
+    @property
+    def interval(self):
+        # Seconds between frames shown
+        return self.step / (self.video.fps * self.speed)
+
+    def next_frame_time(self):
+        # Schedule against the start time rather than the previous frame so
+        # that small delays don't accumulate into drift.
+        return self.started_at + self.frames_read * self.interval
+
+    def set_speed(self, speed):
+        self.speed = speed
+        self.stretcher.speed = speed
+        if self.last_frame is None:
+            self.video.frames.start_stream(self.start_frame, self.step)
+            return
+
+        # Carry on from the last frame shown, with the clock restarted
+        self.anchor_frame = self.last_frame + 1
+        self.video.frames.start_stream(self.anchor_frame, self.step)
+        self.frames_read = 0
+        if self.started_at is not None:
+            self.started_at = time.monotonic()
+        if self.paused_at is not None:
+            self.paused_at = self.started_at
+
+    def frame_at(self, when):
+        # The frame whose audio was heard at `when` (a time.monotonic() value),
+        # allowing for the audio output latency
+        elapsed = when - self.output_latency - self.started_at
+        frame = self.anchor_frame + math.floor(elapsed * self.video.fps * self.speed)
+        return int(min(max(frame, self.start_frame), self.end_frame))
+
+    @property
+    def finished(self):
+        # True once every frame has been read
+        return self.video.frames.stream_finished
+
+    def read(self):
+        # Display the next frame and return its number, or None if it hasn't
+        # been decoded yet (or there are none left, see `finished`).
+        frames = self.video.frames
+        next_frame = frames.next_stream_frame()
+        if next_frame is None:
+            return None
+        slot, current_frame = next_frame
+        # If decoding has fallen behind, drop frames that are already overdue
+        # rather than showing them all in a burst
+        while (
+            frames.stream_frames
+            and self.next_frame_time() + self.interval <= time.monotonic()
+        ):
+            frames.release(slot)
+            self.frames_read += 1
+            slot, current_frame = frames.next_stream_frame()
+        self.video.show(frames.view(slot), current_frame)
+        frames.release(slot)
+        self.frames_read += 1
+        self.last_frame = current_frame
+        return current_frame
+
+    def pause(self):
+        if self.paused_at is None and self.audio_stream is not None:
+            self.paused_at = time.monotonic()
+            self.audio_stream.stop_stream()
+
+    def resume(self):
+        if self.paused_at is not None:
+            self.started_at += time.monotonic() - self.paused_at
+            self.paused_at = None
+            self.audio_stream.start_stream()
 
-        wave_file.close()
-        p.terminate()
+    def stop(self):
+        self.stopped = True
+        self.video.frames.stop_stream()
+        # Unblock the reader thread and stop ffmpeg decoding any further
+        self.audio_buffer.close()
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        if self.audio_stream is not None:
+            self.audio_stream.stop_stream()
+            self.audio_stream.close()
+        if self.pyaudio is not None:
+            self.pyaudio.terminate()
@@ -0,0 +1,117 @@
+from datetime import timedelta
+
+from subtitle_editor.constants import UNSET_FRAME, UNSET_TIME
+from subtitle_editor.subtitles.history import History
+from subtitle_editor.subtitles.srt import SubtitlePad
+
+from ..factories import SubtitleFactory
+
+FPS = 10
+
+
+def pad(count=3, undo_limit=100):
+    subtitles = [
+        SubtitleFactory(
+            start=timedelta(seconds=i * 10), end=timedelta(seconds=i * 10 + 5)
+        )
+        for i in range(count)
+    ]
+    return SubtitlePad(subtitles, 0, 20, 80, FPS, undo_limit=undo_limit)
+
+
+def frames(subtitle_pad):
+    return [(s.get_start(), s.get_end()) for s in subtitle_pad.subtitles]
+
+
+def test_undo_redo():
+    subtitle_pad = pad()
+    original = frames(subtitle_pad)
+    subtitle_pad.set_frame(20)
+    edited = frames(subtitle_pad)
+    assert edited[0] == (20, 50)
+
+    subtitle_pad.undo()
+    assert frames(subtitle_pad) == original
+    subtitle_pad.redo()
+    assert frames(subtitle_pad) == edited
+
+
+def test_undo_restores_clamped_end():
+    # Moving the start past the end also moves the end, which undo reverts
+    subtitle_pad = pad()
+    subtitle_pad.set_frame(80)
+    assert frames(subtitle_pad)[0] == (80, 81)
+
+    subtitle_pad.undo()
+    assert frames(subtitle_pad)[0] == (0, 50)
+
+
+def test_grouped_undo_redo():
+    subtitle_pad = pad()
+    original = frames(subtitle_pad)
+    with subtitle_pad.history.grouped():
+        for index in range(3):
+            subtitle_pad.index = index
+            subtitle_pad.set_frame(index * 100 + 5)
+            # Nested groups are folded into the outermost one
+            with subtitle_pad.history.grouped():
+                subtitle_pad.toggle_selected_timestamp()
+                subtitle_pad.set_frame(index * 100 + 60)
+                subtitle_pad.toggle_selected_timestamp()
+    edited = frames(subtitle_pad)
+    assert len(subtitle_pad.history.undo_stack) == 1
+
+    subtitle_pad.undo()
+    assert frames(subtitle_pad) == original
+    assert subtitle_pad.history.undo() is None
+
+    subtitle_pad.redo()
+    assert frames(subtitle_pad) == edited
+
+
+def test_empty_group_is_not_recorded():
+    history = History()
+    with history.grouped():
+        history.record(0, 0, 0)
+    assert not history.undo_stack
+
+
+def test_limit():
+    subtitle_pad = pad(undo_limit=5)
+    for frame in range(1, 11):
+        subtitle_pad.set_frame(frame)
+    assert len(subtitle_pad.history.undo_stack) == 5
+
+    for _ in range(10):
+        subtitle_pad.undo()
+    # Only the last five edits could be undone
+    assert frames(subtitle_pad)[0] == (5, 50)
+
+
+def test_edit_clears_redo():
+    subtitle_pad = pad()
+    subtitle_pad.set_frame(20)
+    subtitle_pad.undo()
+    assert subtitle_pad.history.redo_stack
+
+    subtitle_pad.set_frame(30)
+    assert not subtitle_pad.history.redo_stack
+    subtitle_pad.redo()
+    assert frames(subtitle_pad)[0] == (30, 50)
+
+
+def test_undo_to_unset_frame():
+    subtitle = SubtitleFactory(start=UNSET_TIME, end=UNSET_TIME)
+    subtitle_pad = SubtitlePad([subtitle], 0, 20, 80, FPS)
+    subtitle_pad.set_frame(20, progress=True)
+    subtitle_pad.set_frame(40)
+    assert frames(subtitle_pad) == [(20, 40)]
+
+    subtitle_pad.undo()
+    assert frames(subtitle_pad) == [(20, UNSET_FRAME)]
+    assert subtitle.end == UNSET_TIME
+    subtitle_pad.undo()
+    assert frames(subtitle_pad) == [(UNSET_FRAME, UNSET_FRAME)]
+    assert subtitle.start == UNSET_TIME
+    assert subtitle_pad.validator.timeline == []
+    assert subtitle_pad.minimap.untimed == 1
@@ -0,0 +1,75 @@
+import random
+from datetime import timedelta
+
+import numpy as np
+import pytest
+
+from subtitle_editor.constants import UNSET_TIME
+from subtitle_editor.subtitles.minimap import Minimap
+from subtitle_editor.subtitles.srt import SubtitlePad
+
+from ..factories import SubtitleFactory
+
+FPS = 25
+FRAME_COUNT = 60 * FPS
+COLUMNS = 80
+
+
+def random_subtitle(rng):
+    if rng.random() < 0.1:
+        return SubtitleFactory(start=UNSET_TIME, end=UNSET_TIME)
+    start = timedelta(seconds=rng.uniform(0, 55))
+    if rng.random() < 0.1:
+        return SubtitleFactory(start=start, end=UNSET_TIME)
+    return SubtitleFactory(
+        start=start, end=start + timedelta(seconds=rng.uniform(0, 5))
+    )
+
+
+def assert_matches_fresh(subtitle_pad):
+    minimap = subtitle_pad.minimap
+    fresh = Minimap(
+        subtitle_pad.subtitles, subtitle_pad.validator, FRAME_COUNT, COLUMNS - 1
+    )
+    np.testing.assert_allclose(minimap.coverage, fresh.coverage, atol=1e-9)
+    np.testing.assert_array_equal(minimap.open_ends, fresh.open_ends)
+    assert minimap.untimed == fresh.untimed
+
+
+def test_coverage():
+    subtitles = [
+        SubtitleFactory(start=timedelta(seconds=0), end=timedelta(seconds=10)),
+        SubtitleFactory(start=timedelta(seconds=5), end=timedelta(seconds=12)),
+        SubtitleFactory(start=timedelta(seconds=30), end=UNSET_TIME),
+        SubtitleFactory(start=UNSET_TIME, end=UNSET_TIME),
+    ]
+    # 4 columns of 10 seconds each, plus room for the count of untimed subtitles
+    subtitle_pad = SubtitlePad(subtitles, 0, 20, 8, 1, frame_count=40)
+    minimap = subtitle_pad.minimap
+    assert minimap.width == 4
+    np.testing.assert_allclose(minimap.coverage, [1.5, 0.2, 0, 0])
+    np.testing.assert_array_equal(minimap.open_ends, [0, 0, 0, 1])
+    assert minimap.untimed == 1
+    assert minimap.subtitle_at(0) == 1
+    assert minimap.subtitle_at(3) == 2
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_update_matches_fresh_minimap(seed):
+    rng = random.Random(seed)
+    subtitles = [random_subtitle(rng) for _ in range(100)]
+    subtitle_pad = SubtitlePad(subtitles, 0, 20, COLUMNS, FPS, frame_count=FRAME_COUNT)
+    assert_matches_fresh(subtitle_pad)
+
+    for _ in range(500):
+        action = rng.random()
+        if action < 0.6:
+            subtitle_pad.index = rng.randrange(len(subtitles))
+            if rng.random() < 0.5:
+                subtitle_pad.toggle_selected_timestamp()
+            subtitle_pad.set_frame(rng.randrange(FRAME_COUNT))
+        elif action < 0.8:
+            subtitle_pad.undo()
+        else:
+            subtitle_pad.redo()
+        assert_matches_fresh(subtitle_pad)
@@ -0,0 +1,219 @@
+import random
+from datetime import timedelta
+
+import numpy as np
+import pytest
+import srt
+
+from subtitle_editor.subtitles.session import (
+    decode_problems,
+    encode_problems,
+    load_session,
+    save_session,
+    session_path,
+)
+from subtitle_editor.subtitles.srt import SubtitlePad
+from subtitle_editor.subtitles.srt_format import compose, parse_file
+from subtitle_editor.subtitles.validator import PROBLEMS
+
+FPS = 25
+COLUMNS = 60
+FRAME_COUNT = 600 * FPS
+WORDS = "the quick brown fox jumps over a lazy dog é ü 字幕 <i>and</i>".split()
+
+
+def random_subtitles(rng, count):
+    subtitles = []
+    for index in range(1, count + 1):
+        start = timedelta(milliseconds=rng.randint(0, 590000))
+        end = start + timedelta(milliseconds=rng.randint(1, 6000))
+        content = "\n".join(
+            " ".join(rng.choices(WORDS, k=rng.randint(1, 15)))
+            for _ in range(rng.randint(1, 3))
+        )
+        if rng.random() < 0.05:
+            # Not valid as it is, so compose() changes it
+            content = content.replace("\n", "\n\n", 1)
+        subtitles.append(srt.Subtitle(index, start, end, content))
+    return subtitles
+
+
+def pad(subtitles, fps=FPS, columns=COLUMNS, session=None):
+    return SubtitlePad(
+        subtitles, 0, 20, columns, fps, frame_count=FRAME_COUNT, session=session
+    )
+
+
+def save(path, subtitle_pad, subtitles):
+    written = []
+    data = compose(subtitles, written).encode("utf-8")
+    path.write_bytes(data)
+    save_session(str(path), data, written, subtitle_pad)
+
+
+@pytest.fixture
+def saved(tmp_path):
+    # Opens a generated file, edits it and saves it with a snapshot. Returns
+    # the path and (selected subtitle's content, lines it's scrolled down by).
+    path = tmp_path / "subtitles.srt"
+    rng = random.Random(0)
+    path.write_text(srt.compose(random_subtitles(rng, 300), reindex=False))
+    subtitles, _ = parse_file(str(path))
+    subtitle_pad = pad(subtitles)
+    for _ in range(50):
+        subtitle_pad.index = rng.randrange(len(subtitles))
+        if rng.random() < 0.5:
+            subtitle_pad.toggle_selected_timestamp()
+        subtitle_pad.set_frame(rng.randrange(FRAME_COUNT))
+    subtitle_pad.index = 123
+    subtitle_pad.selected_timestamp = "end"
+    subtitle_pad.start_line = subtitle_pad.line_offsets()[120]
+    scroll = subtitle_pad.line_offsets()[123] - subtitle_pad.start_line
+    save(path, subtitle_pad, subtitles)
+    return path, (subtitles[123].content, scroll)
+
+
+def fields(subtitle):
+    return (
+        subtitle.index,
+        subtitle.start,
+        subtitle.end,
+        subtitle.content,
+        subtitle.proprietary,
+    )
+
+
+def reopen(path, fps=FPS, columns=COLUMNS):
+    # (pad opened from the snapshot, pad opened by parsing the file)
+    session = load_session(str(path))
+    assert session is not None
+    fresh_subtitles, errors = parse_file(str(path))
+    assert errors == []
+    return (
+        pad(session.subtitles(), fps, columns, session),
+        pad(fresh_subtitles, fps, columns),
+    )
+
+
+@pytest.mark.parametrize("fps,columns", [(FPS, COLUMNS), (30, COLUMNS), (FPS, 45)])
+def test_reopen_matches_parse(saved, fps, columns):
+    restored, fresh = reopen(saved[0], fps, columns)
+    assert len(restored.subtitles) == len(fresh.subtitles)
+
+    for a, b in zip(restored.subtitles, fresh.subtitles):
+        assert fields(a.subtitle) == fields(b.subtitle)
+        assert (a.get_start(), a.get_end()) == (b.get_start(), b.get_end())
+        assert a.nlines() == b.nlines()
+        assert a.wrapped_content == b.wrapped_content
+    assert restored.line_offsets() == fresh.line_offsets()
+
+    assert restored.validator.timeline == fresh.validator.timeline
+    assert restored.validator.problems == fresh.validator.problems
+    assert restored.validator.problems
+    np.testing.assert_allclose(
+        restored.minimap.coverage, fresh.minimap.coverage, atol=1e-9
+    )
+    np.testing.assert_array_equal(restored.minimap.open_ends, fresh.minimap.open_ends)
+
+
+def test_reopen_restores_selection(saved):
+    path, (content, scroll) = saved
+    restored, _ = reopen(path)
+    # The selected subtitle may have moved when the file was sorted
+    assert restored.get_selected_subtitle().subtitle.content == content
+    assert restored.selected_timestamp == "end"
+    assert restored.line_offsets()[restored.index] - restored.start_line == scroll
+
+
+def test_reopening_creates_subtitles_when_used(saved):
+    session = load_session(str(saved[0]))
+    subtitles = session.subtitles()
+    restored = pad(subtitles, session=session)
+    restored.index = 10
+    restored.set_frame(100)
+    restored.showing_at(1000)
+
+    created = [i for i, subtitle in enumerate(restored.subtitles.items) if subtitle]
+    assert 10 in created
+    assert len(created) < len(subtitles) / 2
+    # The same objects every time
+    assert restored.subtitles[10] is restored.subtitles[10]
+    assert restored.subtitles[10].subtitle is subtitles[10]
+
+
+def test_edits_after_reopening(saved):
+    restored, fresh = reopen(saved[0])
+    for subtitle_pad in (restored, fresh):
+        subtitle_pad.index = 10
+        subtitle_pad.selected_timestamp = "start"
+        subtitle_pad.set_frame(100)
+        subtitle_pad.index = 200
+        subtitle_pad.toggle_selected_timestamp()
+        subtitle_pad.set_frame(50)
+    assert restored.validator.problems == fresh.validator.problems
+    np.testing.assert_allclose(
+        restored.minimap.coverage, fresh.minimap.coverage, atol=1e-9
+    )
+
+
+def test_problems_of_written_frames(tmp_path):
+    # At 30 fps the end at frame 89 is written as 00:00:02,966, which is
+    # frame 88 when the file is opened again, so the gap is wide enough
+    path = tmp_path / "subtitles.srt"
+    subtitles = [
+        srt.Subtitle(1, timedelta(0), timedelta(seconds=1), "First"),
+        srt.Subtitle(2, timedelta(seconds=3), timedelta(seconds=5), "Second"),
+    ]
+    subtitle_pad = pad(subtitles, fps=30)
+    subtitle_pad.index = 0
+    subtitle_pad.selected_timestamp = "end"
+    subtitle_pad.set_frame(89)
+    subtitle_pad.index = 1
+    subtitle_pad.selected_timestamp = "start"
+    subtitle_pad.set_frame(90)
+    assert subtitle_pad.validator.problems
+    save(path, subtitle_pad, subtitles)
+
+    restored, fresh = reopen(path, fps=30)
+    assert [(s.get_start(), s.get_end()) for s in restored.subtitles] == [
+        (0, 88),
+        (90, 150),
+    ]
+    assert restored.validator.problems == fresh.validator.problems == {}
+
+
+def test_content_offsets(saved):
+    path, _ = saved
+    session = load_session(str(path))
+    data = path.read_bytes()
+    fresh_subtitles = list(srt.parse(data.decode("utf-8")))
+    for record, subtitle in zip(session.records, fresh_subtitles):
+        start, end = int(record["content_start"]), int(record["content_end"])
+        assert data[start:end].decode("utf-8") == subtitle.content
+
+
+def test_modified_file_is_rejected(saved):
+    path, _ = saved
+    path.write_bytes(path.read_bytes().replace(b"fox", b"cat", 1))
+    assert load_session(str(path)) is None
+
+
+def test_corrupt_snapshot_is_rejected(saved):
+    path, _ = saved
+    with open(session_path(str(path)), "r+b") as fp:
+        fp.truncate(100)
+    assert load_session(str(path)) is None
+
+
+def test_proprietary_metadata_is_not_saved(tmp_path):
+    path = tmp_path / "subtitles.srt"
+    subtitles = random_subtitles(random.Random(1), 10)
+    subtitles[3].proprietary = "X1:100"
+    save(path, pad(subtitles), subtitles)
+    assert load_session(str(path)) is None
+
+
+def test_problems_round_trip():
+    for count in range(len(PROBLEMS) + 1):
+        problems = tuple(random.Random(count).sample(PROBLEMS, count))
+        assert decode_problems(encode_problems(problems)) == problems
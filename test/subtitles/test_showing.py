@@ -0,0 +1,70 @@
+import random
+from datetime import timedelta
+
+import pytest
+
+from subtitle_editor.constants import UNSET_FRAME, UNSET_TIME
+from subtitle_editor.subtitles.srt import SubtitlePad
+
+from ..factories import SubtitleFactory
+
+FPS = 10
+FRAME_COUNT = 60 * FPS
+
+
+def random_subtitle(rng):
+    start = timedelta(seconds=rng.uniform(0, 55))
+    if rng.random() < 0.1:
+        return SubtitleFactory(start=start, end=UNSET_TIME)
+    # Now and then one that lasts long enough to overlap many others
+    length = rng.uniform(0, 30 if rng.random() < 0.05 else 4)
+    return SubtitleFactory(start=start, end=start + timedelta(seconds=length))
+
+
+def expected_showing(subtitle_pad, frame):
+    # Every subtitle with an end that covers `frame`, plus the last one to
+    # start before it if it has no end
+    subtitles = subtitle_pad.subtitles
+    started = [
+        (s.get_start(), i)
+        for i, s in enumerate(subtitles)
+        if s.get_start() != UNSET_FRAME and s.get_start() <= frame
+    ]
+    showing = {i for _, i in started if frame < subtitles[i].get_end() != UNSET_FRAME}
+    if started and subtitles[max(started)[1]].get_end() == UNSET_FRAME:
+        showing.add(max(started)[1])
+    return sorted(showing)
+
+
+def test_showing_at():
+    subtitles = [
+        SubtitleFactory(start=timedelta(seconds=0), end=timedelta(seconds=10)),
+        SubtitleFactory(start=timedelta(seconds=2), end=timedelta(seconds=3)),
+        SubtitleFactory(start=timedelta(seconds=5), end=UNSET_TIME),
+        SubtitleFactory(start=timedelta(seconds=20), end=timedelta(seconds=25)),
+    ]
+    subtitle_pad = SubtitlePad(subtitles, 0, 20, 80, FPS, frame_count=FRAME_COUNT)
+    assert subtitle_pad.showing_at(25) == [0, 1]
+    assert subtitle_pad.showing_at(60) == [0, 2]
+    # The subtitle without an end stops showing when the next one starts
+    assert subtitle_pad.showing_at(150) == [2]
+    assert subtitle_pad.showing_at(210) == [3]
+    assert subtitle_pad.showing_at(300) == []
+    assert subtitle_pad.next_text_at(30) == (50, subtitle_pad.get_text_at(50))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_showing_at_after_edits(seed):
+    rng = random.Random(seed)
+    subtitles = [random_subtitle(rng) for _ in range(100)]
+    subtitle_pad = SubtitlePad(subtitles, 0, 20, 80, FPS, frame_count=FRAME_COUNT)
+
+    for _ in range(100):
+        subtitle_pad.index = rng.randrange(len(subtitles))
+        if rng.random() < 0.5:
+            subtitle_pad.toggle_selected_timestamp()
+        subtitle_pad.set_frame(rng.randrange(FRAME_COUNT))
+        for frame in rng.sample(range(FRAME_COUNT), 10):
+            assert subtitle_pad.showing_at(frame) == expected_showing(
+                subtitle_pad, frame
+            )
@@ -0,0 +1,173 @@
+import random
+from datetime import timedelta
+
+import pytest
+import srt
+
+from subtitle_editor.subtitles import srt_format
+
+WORDS = "the quick brown fox jumps over a lazy dog <i>and</i> é ü 字幕".split()
+
+
+def random_content(rng):
+    return "\n".join(
+        " ".join(rng.choices(WORDS, k=rng.randint(1, 6)))
+        for _ in range(rng.randint(1, 3))
+    )
+
+
+def random_file(rng, count):
+    # Returns (lines, {line number: block}) for a file of `count` blocks,
+    # some of which are malformed, separated by a varying number of blank
+    # (or whitespace-only) lines
+    lines = [""] * rng.randint(0, 2)
+    malformed = {}
+    for index in range(1, count + 1):
+        start = timedelta(milliseconds=rng.randint(0, 10 ** 7))
+        end = start + timedelta(milliseconds=rng.randint(1, 5000))
+        block = [
+            str(index),
+            f"{srt.timedelta_to_srt_timestamp(start)} --> "
+            f"{srt.timedelta_to_srt_timestamp(end)}",
+        ] + random_content(rng).split("\n")
+
+        kind = rng.random()
+        if kind < 0.1:
+            block[0] = "x"
+        elif kind < 0.2:
+            block[1] = "00:00:01,000 -> 00:00:02,000"
+        elif kind < 0.3:
+            block[1] = block[1].replace(":", ";", 1)
+        elif kind < 0.35:
+            block = block[:1]
+        if kind < 0.35:
+            malformed[len(lines) + 1] = block
+
+        lines.extend(block)
+        lines.extend(rng.choice(["", " ", "\t "]) for _ in range(rng.randint(1, 3)))
+    return lines, malformed
+
+
+@pytest.mark.parametrize("chunk_size", [16, 100, 1024, srt_format.PARSE_CHUNK_SIZE])
+@pytest.mark.parametrize("eol", ["\n", "\r\n"])
+@pytest.mark.parametrize("seed", range(3))
+def test_parse_file_error_lines(tmp_path, monkeypatch, chunk_size, eol, seed):
+    monkeypatch.setattr(srt_format, "PARSE_CHUNK_SIZE", chunk_size)
+    lines, malformed = random_file(random.Random(seed), 200)
+    path = tmp_path / "subtitles.srt"
+    path.write_bytes(eol.join(lines).encode())
+
+    subtitles, errors = srt_format.parse_file(path)
+    assert [line_number for line_number, _ in errors] == sorted(malformed)
+
+    valid = [block for block in blocks(lines) if block not in malformed.values()]
+    expected = srt.parse("\n\n".join("\n".join(block) for block in valid))
+    assert subtitles == list(expected)
+
+
+def blocks(lines):
+    result = [[]]
+    for line in lines:
+        if line.strip():
+            result[-1].append(line)
+        elif result[-1]:
+            result.append([])
+    return [block for block in result if block]
+
+
+def test_parse_file_byte_order_mark(tmp_path):
+    path = tmp_path / "subtitles.srt"
+    path.write_bytes(b"\xef\xbb\xbf1\n00:00:01,000 --> 00:00:02,000\nHello\n")
+    subtitles, errors = srt_format.parse_file(path)
+    assert errors == []
+    assert [s.content for s in subtitles] == ["Hello"]
+
+
+def test_parse_file_without_numbers(tmp_path):
+    path = tmp_path / "subtitles.srt"
+    text = (
+        "00:00:01,000 --> 00:00:02,000\nHello\n\n"
+        "2\n00:00:03,000 --> 00:00:04,000\nThere\n\n"
+        "00:00:05,000 --> 00:00:06,000 X1:1\nAgain\n"
+    )
+    path.write_text(text)
+    subtitles, errors = srt_format.parse_file(path)
+    assert errors == []
+    assert subtitles == list(srt.parse(text))
+    assert [s.index for s in subtitles] == [None, 2, None]
+
+
+def test_parse_file_non_ascii_digits(tmp_path):
+    path = tmp_path / "subtitles.srt"
+    path.write_text(
+        "²\n00:00:01,000 --> 00:00:02,000\nHello\n\n"
+        "2\n00:00:03,000 --> 00:00:04,000\nThere\n"
+    )
+    subtitles, errors = srt_format.parse_file(path)
+    assert [line_number for line_number, _ in errors] == [1]
+    assert [s.content for s in subtitles] == ["There"]
+
+
+def test_parse_file_empty(tmp_path):
+    path = tmp_path / "subtitles.srt"
+    path.write_bytes(b"")
+    assert srt_format.parse_file(path) == ([], [])
+
+
+@pytest.mark.parametrize(
+    "text,expected",
+    [
+        ("01:02:03,456", timedelta(hours=1, minutes=2, seconds=3, milliseconds=456)),
+        ("01:02:03.456", timedelta(hours=1, minutes=2, seconds=3, milliseconds=456)),
+        ("1:2:3,4", timedelta(hours=1, minutes=2, seconds=3, milliseconds=400)),
+        ("100:00:00", timedelta(hours=100)),
+    ],
+)
+def test_parse_timestamp(text, expected):
+    assert srt_format.parse_timestamp(text) == expected
+
+
+def random_subtitle(rng, index):
+    start = timedelta(milliseconds=rng.randint(-2000, 10 ** 8))
+    end = start + timedelta(milliseconds=rng.randint(-1000, 5000))
+    content = rng.choice(
+        [
+            random_content(rng),
+            random_content(rng),
+            "",
+            " \n ",
+            f"{random_content(rng)}\n\n{random_content(rng)}",
+            f"\n{random_content(rng)}",
+        ]
+    )
+    proprietary = rng.choice(["", "", "X1:100 X2:200"])
+    return srt.Subtitle(rng.choice([index, None]), start, end, content, proprietary)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_compose_matches_srt(seed):
+    rng = random.Random(seed)
+    subtitles = [random_subtitle(rng, index) for index in range(300)]
+    # Subtitles with the same times are sorted by index, which srt.compose
+    # can't do with None
+    expected = srt.compose(
+        [
+            srt.Subtitle(s.index or 0, s.start, s.end, s.content, s.proprietary)
+            for s in subtitles
+        ]
+    )
+    assert srt_format.compose(subtitles) == expected
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_compose_written_offsets(seed):
+    rng = random.Random(seed)
+    subtitles = [random_subtitle(rng, index) for index in range(300)]
+    written = []
+    data = srt_format.compose(subtitles, written).encode("utf-8")
+
+    parsed = list(srt.parse(data.decode("utf-8")))
+    assert len(written) == len(parsed)
+    for (subtitle, start, end), expected in zip(written, parsed):
+        assert subtitle.start == expected.start
+        assert data[start:end].decode("utf-8") == expected.content
@@ -0,0 +1,180 @@
+import random
+from datetime import timedelta
+from textwrap import TextWrapper
+
+import pytest
+
+from subtitle_editor.constants import UNSET_FRAME, UNSET_TIME
+from subtitle_editor.subtitles.srt import SubtitleEntry
+from subtitle_editor.subtitles.validator import (
+    OUT_OF_ORDER,
+    OVERLAP,
+    TOO_CLOSE,
+    TOO_SHORT,
+    Validator,
+)
+
+from ..factories import SubtitleFactory
+
+FPS = 10
+
+
+def entries(*times):
+    # One entry per (start, end) in seconds, or None for an unset time
+    wrapper = TextWrapper(width=40)
+    return [
+        SubtitleEntry(
+            SubtitleFactory(
+                start=UNSET_TIME if start is None else timedelta(seconds=start),
+                end=UNSET_TIME if end is None else timedelta(seconds=end),
+            ),
+            wrapper,
+            FPS,
+        )
+        for start, end in times
+    ]
+
+
+def validator(subtitles):
+    return Validator(subtitles, FPS, min_duration=timedelta(seconds=1), min_gap=2)
+
+
+def test_no_problems():
+    subtitles = entries((0, 2), (3, 5), (6, 8))
+    assert validator(subtitles).problems == {}
+
+
+@pytest.mark.parametrize(
+    "times,problems",
+    [
+        (((0, 2), (3, 3.5)), {1: (TOO_SHORT,)}),
+        (((3, 5), (0, 2)), {1: (OUT_OF_ORDER,)}),
+        (((0, 2), (1, 3)), {0: (OVERLAP,), 1: (OVERLAP,)}),
+        (((0, 2), (2.1, 4)), {0: (TOO_CLOSE,), 1: (TOO_CLOSE,)}),
+        (((0, 2), (1.5, 1.8)), {0: (OVERLAP,), 1: (TOO_SHORT, OVERLAP)}),
+    ],
+)
+def test_problem(times, problems):
+    assert validator(entries(*times)).problems == problems
+
+
+def test_unset_times_are_not_problems():
+    subtitles = entries((0, None), (1, 3), (None, None), (None, 5))
+    assert validator(subtitles).problems == {}
+
+
+def test_cue_containing_several_later_cues():
+    subtitles = entries((0, 100), (10, 12), (20, 22), (101, 103))
+    assert validator(subtitles).problems == {
+        0: (OVERLAP,),
+        1: (OVERLAP,),
+        2: (OVERLAP,),
+    }
+
+
+def test_update_cue_containing_several_later_cues():
+    subtitles = entries((0, 5), (10, 12), (20, 22), (30, 32))
+    checker = validator(subtitles)
+    assert checker.problems == {}
+
+    subtitles[0].set_end(25 * FPS)
+    checker.update(0)
+    assert checker.problems == {0: (OVERLAP,), 1: (OVERLAP,), 2: (OVERLAP,)}
+
+    subtitles[0].set_end(5 * FPS)
+    checker.update(0)
+    assert checker.problems == {}
+
+
+def random_edit(subtitles, rng):
+    index = rng.randrange(len(subtitles))
+    entry = subtitles[index]
+    frame = rng.randrange(0, 60 * FPS)
+    action = rng.random()
+    if action < 0.4:
+        entry.set_start(frame)
+    elif action < 0.8:
+        entry.set_end(frame)
+    elif action < 0.9:
+        entry.restore(UNSET_FRAME, UNSET_FRAME)
+    else:
+        entry.restore(frame, UNSET_FRAME)
+    return index
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_update_matches_validate(seed):
+    rng = random.Random(seed)
+    times = []
+    for _ in range(30):
+        start = rng.uniform(0, 60)
+        times.append((start, start + rng.uniform(0.1, 10)))
+    subtitles = entries(*times)
+    checker = validator(subtitles)
+
+    for _ in range(300):
+        checker.update(random_edit(subtitles, rng))
+        fresh = validator(subtitles)
+        assert checker.timeline == fresh.timeline
+        assert checker.problems == fresh.problems
+        assert checker.problem_indices == sorted(fresh.problems)
+
+
+def test_update_after_given_problems():
+    subtitles = entries((0, 100), (10, 12), (20, 22))
+    fresh = validator(subtitles)
+    checker = Validator(
+        subtitles,
+        FPS,
+        min_duration=timedelta(seconds=1),
+        min_gap=2,
+        timeline=list(fresh.timeline),
+        problems=fresh.problems,
+    )
+
+    subtitles[2].set_start(200 * FPS)
+    checker.update(2)
+    assert checker.problems == validator(subtitles).problems
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_update_after_given_ends(seed):
+    # The sweep worked out from the given end frames is the same as one done
+    # subtitle by subtitle, including once the subtitles have changed
+    rng = random.Random(seed)
+    times = []
+    for _ in range(30):
+        start = rng.uniform(0, 60)
+        end = start + rng.uniform(0.1, 10) if rng.random() < 0.9 else None
+        times.append((start, end))
+    subtitles = entries(*times)
+    fresh = validator(subtitles)
+    checker = Validator(
+        subtitles,
+        FPS,
+        min_duration=timedelta(seconds=1),
+        min_gap=2,
+        timeline=list(fresh.timeline),
+        problems=fresh.problems,
+        ends=[subtitle.get_end() for subtitle in subtitles],
+    )
+    for _, index in fresh.timeline:
+        assert checker.latest_end_before(index) == fresh.latest_end_before(index)
+
+    for _ in range(100):
+        checker.update(random_edit(subtitles, rng))
+        assert checker.problems == validator(subtitles).problems
+
+
+def test_next_problem_wraps_around():
+    subtitles = entries((0, 2), (1, 3), (4, 6), (7, 7.5), (9, 11))
+    checker = validator(subtitles)
+    assert checker.problem_indices == [0, 1, 3]
+    assert checker.next_problem(0) == 1
+    assert checker.next_problem(1) == 3
+    assert checker.next_problem(3) == 0
+    assert checker.next_problem(4) == 0
+
+
+def test_next_problem_without_problems():
+    assert validator(entries((0, 2))).next_problem(0) is None
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from subtitle_editor import align as align_module
+from subtitle_editor.align import align, assign_lines, find_speech, split_units
+from subtitle_editor.constants import ALIGN_WINDOW_SECONDS
+
+# Six 2 second sentences with 1 second pauses between them
+SPEECH = [(1 + 3 * i, 3 + 3 * i) for i in range(6)]
+
+
+def window(seconds):
+    return round(seconds / ALIGN_WINDOW_SECONDS)
+
+
+def envelope(regions, length, seed=0):
+    # Quiet noise, with loud (speech or music) regions given in seconds
+    rng = np.random.default_rng(seed)
+    result = rng.uniform(0, 0.02, window(length))
+    for start, end in regions:
+        result[window(start) : window(end)] = rng.uniform(
+            0.6, 1.0, window(end) - window(start)
+        )
+    return result.astype(np.float32)
+
+
+@pytest.fixture
+def aligned(monkeypatch):
+    # Aligns lines to an envelope instead of a video's audio track
+    def aligned(regions, length, lines):
+        monkeypatch.setattr(
+            align_module,
+            "load_envelope",
+            lambda path, cache=None: envelope(regions, length),
+        )
+        return align("video.mp4", lines)
+
+    return aligned
+
+
+def rounded(times):
+    return [(round(start, 1), round(end, 1)) for start, end in times]
+
+
+def test_find_speech():
+    starts, ends = find_speech(envelope(SPEECH, 20))
+    assert (
+        rounded(zip(starts * ALIGN_WINDOW_SECONDS, ends * ALIGN_WINDOW_SECONDS))
+        == SPEECH
+    )
+
+
+def test_find_speech_bridges_short_gaps():
+    starts, ends = find_speech(envelope([(1, 3), (3.1, 5), (8, 10)], 12))
+    assert rounded(zip(starts * ALIGN_WINDOW_SECONDS, ends * ALIGN_WINDOW_SECONDS)) == [
+        (1, 5),
+        (8, 10),
+    ]
+
+
+def test_find_speech_in_silence():
+    starts, ends = find_speech(np.zeros(0, dtype=np.float32))
+    assert len(starts) == len(ends) == 0
+
+
+def test_split_units():
+    starts, ends = split_units(np.array([0, 100]), np.array([25, 110]), 10)
+    assert starts.tolist() == [0, 8, 16, 100]
+    assert ends.tolist() == [8, 16, 25, 110]
+
+
+def test_assign_lines_to_regions():
+    starts, ends = split_units(np.array([0, 300, 500]), np.array([200, 400, 600]), 50)
+    assignments = assign_lines(np.array([2.0, 1, 1]), starts, ends)
+    # The first line is twice as long, so gets the first region
+    assert assignments.tolist() == [[0, 4], [4, 6], [6, 8]]
+
+
+def test_lines_follow_speech(aligned):
+    lines = ["the same length"] * len(SPEECH)
+    assert rounded(aligned(SPEECH, 20, lines)) == SPEECH
+
+
+def test_music_is_skipped(aligned):
+    # Ten seconds of music between two sets of sentences
+    speech = SPEECH + [(start + 30, end + 30) for start, end in SPEECH]
+    lines = ["the same length"] * len(speech)
+    assert rounded(aligned(speech + [(20, 30)], 50, lines)) == speech
+
+
+def test_fewer_units_than_lines(aligned):
+    # A fifth of a second of speech is only 20 windows
+    lines = ["a line"] * 30
+    assert aligned([(1, 1.2)], 1.5, lines) == [(None, None)] * 30
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from subtitle_editor.audio import RingBuffer, TimeStretcher
+from subtitle_editor.constants import STRETCH_WINDOW
+
+CHANNELS = 2
+
+
+def stretch(samples, speed):
+    buffer = RingBuffer(samples.nbytes)
+    buffer.write(samples.tobytes())
+    buffer.finish()
+    stretcher = TimeStretcher(buffer, CHANNELS)
+    stretcher.speed = speed
+
+    output = bytearray()
+    while not stretcher.done:
+        output += stretcher.read(4096)
+    return np.frombuffer(bytes(output), dtype=np.int16).reshape(-1, CHANNELS)
+
+
+@pytest.fixture
+def samples():
+    rng = np.random.default_rng(0)
+    return rng.integers(-20000, 20000, (44100, CHANNELS), dtype=np.int16)
+
+
+def test_normal_speed_reproduces_input(samples):
+    output = stretch(samples, 1)
+    assert np.array_equal(output[: len(samples)], samples)
+    # Anything after the input is silence
+    assert not output[len(samples) :].any()
+
+
+@pytest.mark.parametrize("speed", [0.5, 1.5, 2])
+def test_other_speeds_change_length(samples, speed):
+    output = stretch(samples, speed)
+    # Give or take the last window
+    assert abs(len(output) - len(samples) / speed) <= STRETCH_WINDOW
@@ -0,0 +1,116 @@
+import os
+
+import pytest
+
+from subtitle_editor.cache import MediaCache
+from subtitle_editor.constants import CACHE_VERSION
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return MediaCache(str(tmp_path / "cache"), max_size=1000)
+
+
+@pytest.fixture
+def media(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(os.urandom(300 * 1024))
+    return path
+
+
+def set_mtime(path, seconds):
+    os.utime(path, (seconds, seconds))
+
+
+def test_key_is_stable(cache, media, tmp_path):
+    key = cache.key(media)
+    assert cache.key(media) == key
+
+    # Moving the file keeps the key
+    moved = tmp_path / "moved.mp4"
+    os.rename(media, moved)
+    assert cache.key(moved) == key
+
+
+def test_key_changes_with_contents(cache, media):
+    key = cache.key(media)
+    stat = os.stat(media)
+    with open(media, "r+b") as fp:
+        fp.seek(stat.st_size // 2)
+        fp.write(b"changed")
+    # Even with the same size and modification time
+    os.utime(media, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert cache.key(media) != key
+
+
+def test_key_changes_with_mtime(cache, media):
+    key = cache.key(media)
+    set_mtime(media, 1000)
+    assert cache.key(media) != key
+
+
+def test_key_of_small_file(cache, tmp_path):
+    path = tmp_path / "small"
+    path.write_bytes(b"tiny")
+    assert len(cache.key(path)) == 32
+
+
+def test_entry_path_is_versioned(cache):
+    path = cache.entry_path("abc", "probe")
+    assert os.path.dirname(path) == cache.directory
+    assert os.path.basename(path) == f"abc.probe.v{CACHE_VERSION}"
+
+
+def test_json_round_trip(cache):
+    assert cache.get_json("abc", "probe") is None
+    cache.put_json("abc", "probe", {"fps": 25})
+    assert cache.get_json("abc", "probe") == {"fps": 25}
+
+
+def test_invalid_json_is_a_miss(cache):
+    with open(cache.entry_path("abc", "probe"), "w") as fp:
+        fp.write("{")
+    assert cache.get_json("abc", "probe") is None
+
+
+def store_bytes(cache, key, size):
+    def write(path):
+        with open(path, "wb") as fp:
+            fp.write(b"x" * size)
+
+    return cache.store(key, "data", write)
+
+
+def test_evicts_least_recently_used(cache):
+    paths = [store_bytes(cache, key, 300) for key in "abc"]
+    for number, path in enumerate(paths):
+        set_mtime(path, 1000 + number)
+    # Using an entry makes it the most recently used
+    assert cache.get_path("a", "data") == paths[0]
+
+    store_bytes(cache, "d", 300)
+    assert not os.path.exists(paths[1])
+    assert all(os.path.exists(path) for path in (paths[0], paths[2]))
+    assert cache.get_path("b", "data") is None
+
+
+def test_size_limit(cache):
+    assert cache.fits(1000)
+    assert not cache.fits(1001)
+
+    store_bytes(cache, "a", 600)
+    store_bytes(cache, "b", 600)
+    sizes = [entry.stat().st_size for entry in os.scandir(cache.directory)]
+    assert sum(sizes) <= 1000
+
+
+def test_failed_write_leaves_nothing_behind(cache):
+    def write(path):
+        with open(path, "wb") as fp:
+            fp.write(b"partial")
+        raise RuntimeError("decoding failed")
+
+    with pytest.raises(RuntimeError):
+        cache.store("abc", "audio", write)
+    assert cache.get_path("abc", "audio") is None
+    assert os.listdir(cache.directory) == []
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("pyaudio")
+
+from subtitle_editor.calibration import Calibration, beep_times  # noqa: E402
+
+
+def test_beep_times():
+    times = beep_times(20, 0.8, 2.2, 1.5, rng=np.random.default_rng(0))
+    assert len(times) == 20
+    assert times[0] == 1.5
+    gaps = np.diff(times)
+    assert ((gaps >= 0.8) & (gaps <= 2.2)).all()
+    # Not a steady rhythm
+    assert gaps.std() > 0.1
+
+
+def calibration(delays, heard_at=100):
+    calibration = Calibration(beeps=len(delays))
+    calibration.heard_at = heard_at
+    calibration.taps = [
+        heard_at + time + delay
+        for time, delay in zip(calibration.beep_times, delays)
+        if delay is not None
+    ]
+    return calibration
+
+
+def test_offset_is_median_delay():
+    assert calibration([0.2, 0.25, 0.3, 0.22, 0.4]).offset() == pytest.approx(0.25)
+
+
+def test_offset_counts_the_first_tap_per_beep():
+    subject = calibration([0.2, 0.2, 0.2, 0.2])
+    subject.taps.append(subject.taps[-1] + 0.05)
+    subject.taps.sort()
+    assert subject.offset() == pytest.approx(0.2)
+
+
+def test_offset_without_enough_taps():
+    assert calibration([0.2, None, None, None]).offset() is None
+    assert Calibration().offset() is None
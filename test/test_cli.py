@@ -0,0 +1,42 @@
+import ffmpeg
+import pytest
+from click.testing import CliRunner
+
+pytest.importorskip("pyaudio")
+
+from subtitle_editor import cli as cli_module  # noqa: E402
+from subtitle_editor.cli import cli  # noqa: E402
+
+
+@pytest.fixture
+def export(tmp_path, monkeypatch):
+    # Runs the export command with export_video raising `error`
+    video = tmp_path / "video.mp4"
+    video.write_bytes(b"")
+    subtitles = tmp_path / "subtitles.srt"
+    subtitles.write_text("1\n00:00:01,000 --> 00:00:02,000\nHello\n")
+
+    def export(error):
+        def export_video(*args):
+            raise error
+
+        monkeypatch.setattr(cli_module, "export_video", export_video)
+        return CliRunner().invoke(
+            cli, ["export", str(video), str(subtitles), str(tmp_path / "out.mp4")]
+        )
+
+    return export
+
+
+def test_export_without_video_stream(export):
+    result = export(StopIteration())
+    assert result.exit_code == 1
+    assert "has no video stream" in result.output
+
+
+def test_export_ffmpeg_error(export):
+    stderr = b"[libx264] first line\nout.mp4: Permission denied\n"
+    result = export(ffmpeg.Error("ffmpeg", None, stderr))
+    assert result.exit_code == 1
+    assert "Could not export the video: out.mp4: Permission denied" in result.output
+    assert "Traceback" not in result.output